@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import torch
+from model.GNN import TemporalForecastingGNN
+from utils.topology import build_topology, clear_topology_cache
+from utils.snapshot_store import SnapshotStore
+from utils.lots import LotRegistry
+from utils.temporal_dataset import LazyTemporalDataset
+from utils.geometric_graphs import StoreSequence, process_csv, process_csv_file
+from utils.create_graphs import OccupancyDetector
+from utils.train_utils import train_loop
+from evaluate import evaluate_and_save_predictions
+from model.inference import LotForecaster
+from export import compare_forecasters
+
+BENCHMARKS = ("graph", "features", "differencing", "train", "inference", "evaluate", "quantize")
+
+def make_synthetic_lot(num_nodes, num_frames, spacing=25.0, flip_rate=0.02, seed=0):
+    # Spots on a jittered grid with occupancy that flips as a Markov chain, one
+    # frame per second, so neither the graph nor the labels are degenerate.
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(num_nodes)))
+    grid = np.stack(np.divmod(np.arange(num_nodes), cols), axis=1)[:, ::-1] * spacing + spacing
+    coords = np.round(grid + rng.uniform(-spacing / 4, spacing / 4, grid.shape)).astype(np.int64)
+    nodes = pd.DataFrame({
+        "node_id": np.arange(num_nodes),
+        "x_pixel": coords[:, 0],
+        "y_pixel": coords[:, 1],
+        "is_handicapped": (rng.random(num_nodes) < 0.05).astype(np.int64),
+    })
+
+    flips = rng.random((num_frames, num_nodes)) < flip_rate
+    initial = rng.random(num_nodes) < 0.5
+    occupancy = (np.cumsum(flips, axis=0) % 2 ^ initial).astype(np.uint8)
+    timestamps = 1.7e9 + np.arange(num_frames, dtype=np.float64)
+    store_center = tuple(coords.max(axis=0) / 2)
+    return SnapshotStore.from_arrays(nodes, occupancy, timestamps, store_center=store_center, lot_id="synthetic")
+
+def synthetic_frames(store, window_size, num_frames, seed=0):
+    # Gray frames with a bright patch on every occupied spot over sensor noise.
+    rng = np.random.default_rng(seed)
+    coords = store.coords.astype(np.int64)
+    height, width = coords[:, 1].max() + 2 * window_size, coords[:, 0].max() + 2 * window_size
+    for t in range(num_frames):
+        frame = rng.integers(90, 110, (height, width), dtype=np.uint8)
+        for (x, y) in coords[store.occupancy(t).astype(bool)]:
+            frame[max(0, y - window_size):y + window_size, max(0, x - window_size):x + window_size] = 200
+        yield frame
+
+def timed(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.asarray(times)
+    return {"min_s": float(times.min()), "median_s": float(np.median(times)), "mean_s": float(times.mean())}
+
+def peak_rss_mb():
+    # High-water mark of the whole process, not of any one benchmark; ru_maxrss
+    # is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def bench_graph(store, args):
+    coords = store.coords
+
+    def build():
+        clear_topology_cache()
+        build_topology(coords, args.threshold)
+
+    result = timed(build, args.repeat)
+    edge_index, _ = build_topology(coords, args.threshold)
+    result["edges"] = int(edge_index.shape[1])
+    return result
+
+def bench_features(store, args):
+    sequence = StoreSequence(store, args.threshold, lot=LotRegistry().register_store(store))
+    frames = range(min(len(store), args.feature_frames))
+    result = {"store": timed(lambda: [sequence.snapshot(t) for t in frames], args.repeat)}
+    result["store"]["frames_per_s"] = len(frames) / result["store"]["median_s"]
+
+    # The legacy per-frame CSV path: enrich every label CSV, then parse it.
+    # Files are named like real DJI frames so timestamps parse as they would.
+    workdir = tempfile.mkdtemp(prefix="bench_csv_")
+    try:
+        nodes = store.nodes
+        paths = []
+        for t in frames:
+            path = os.path.join(workdir, f"DJI_20250101120000_{t:04d}_V.csv")
+            nodes.assign(is_occupied=store.occupancy(t)).to_csv(path, index=False)
+            paths.append(path)
+
+        def process():
+            for path in paths:
+                process_csv_file(path, "DJI_20250101120000_0001_V", os.path.basename(path), *store.store_center)
+                process_csv(path)
+
+        result["csv"] = timed(process, args.repeat)
+        result["csv"]["frames_per_s"] = len(paths) / result["csv"]["median_s"]
+    finally:
+        shutil.rmtree(workdir)
+    return result
+
+def bench_differencing(store, args):
+    frames = list(synthetic_frames(store, args.window_size, min(len(store), args.diff_frames), args.seed))
+
+    def run():
+        detector = OccupancyDetector(store.coords.astype(np.int64), store.occupancy(0), args.window_size)
+        for frame in frames:
+            detector.update(frame)
+
+    result = timed(run, args.repeat)
+    result["frames_per_s"] = len(frames) / result["median_s"]
+    result["frame_shape"] = list(frames[0].shape)
+    return result
+
+def make_model(args, device):
+    torch.manual_seed(args.seed)
+    return TemporalForecastingGNN(node_features=4, hidden_features=args.hidden).to(device)
+
+def bench_train(store, args, device):
+    sequence = StoreSequence(store, args.threshold, lot=LotRegistry().register_store(store))
+    dataset = LazyTemporalDataset([sequence], batch_size=args.batch_size, prefetch=2, num_workers=2)
+    dataset = dataset[:min(len(dataset), args.train_steps)]
+    model = make_model(args, device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.01)
+    criterion = torch.nn.BCEWithLogitsLoss()
+
+    result = timed(lambda: train_loop(dataset, model, criterion, optimizer, device, verbose=False),
+                   args.repeat, warmup=1)
+    result["steps"] = len(dataset)
+    result["steps_per_s"] = len(dataset) / result["median_s"]
+    result["snapshots_per_s"] = len(dataset) * args.batch_size / result["median_s"]
+    return result
+
+def bench_inference(store, args, device):
+    # Latency of one live step: a single lot frame through the stateful model.
+    sequence = StoreSequence(store, args.threshold, lot=LotRegistry().register_store(store))
+    dataset = LazyTemporalDataset([sequence], batch_size=1, prefetch=0)
+    model = make_model(args, device).eval()
+    snapshots = [dataset[t].to(device) for t in range(min(len(dataset), args.inference_steps))]
+
+    state = None
+    for snapshot in snapshots[:5]:
+        _, state = model.step(snapshot, state)
+
+    latencies = []
+    for snapshot in snapshots:
+        start = time.perf_counter()
+        probs, state = model.step(snapshot, state)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        latencies.append(time.perf_counter() - start)
+    latencies = np.asarray(latencies) * 1000.0
+    return {
+        "steps": len(latencies),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+def bench_evaluate(store, args, device):
+    sequence = StoreSequence(store, args.threshold, lot=LotRegistry().register_store(store))
+    dataset = LazyTemporalDataset([sequence], batch_size=args.batch_size)
+    dataset = dataset[:min(len(dataset), args.train_steps)]
+    model = make_model(args, device)
+    workdir = tempfile.mkdtemp(prefix="bench_eval_")
+    try:
+        output_path = os.path.join(workdir, "predictions.npys")
+        result = timed(lambda: evaluate_and_save_predictions(dataset, model, device, output_path=output_path),
+                       args.repeat, warmup=0)
+    finally:
+        shutil.rmtree(workdir)
+    result["snapshots_per_s"] = len(dataset) * args.batch_size / result["median_s"]
+    return result
+
+def bench_quantize(store, args, device):
+    # Exported per-lot forecaster, fp32 vs int8 dynamic quantization; always
+    # on the CPU, which is where the edge artifact runs.
+    forecaster = LotForecaster(make_model(args, torch.device("cpu")), LotRegistry().register_store(store),
+                               args.threshold)
+    return compare_forecasters(forecaster, store, args.inference_steps)
+
+BENCHMARK_FNS = {
+    "graph": bench_graph,
+    "features": bench_features,
+    "differencing": bench_differencing,
+    "train": bench_train,
+    "inference": bench_inference,
+    "evaluate": bench_evaluate,
+    "quantize": bench_quantize,
+}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(args):
+    device = torch.device(args.device)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    store = make_synthetic_lot(args.nodes, args.frames, seed=args.seed)
+    selected = args.only.split(",") if args.only else BENCHMARKS
+
+    results = {}
+    for name in selected:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {name!r}; choose from {', '.join(BENCHMARKS)}")
+        print(f"Running {name}...")
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        if name in ("train", "inference", "evaluate", "quantize"):
+            results[name] = BENCHMARK_FNS[name](store, args, device)
+        else:
+            results[name] = BENCHMARK_FNS[name](store, args)
+        if device.type == "cuda":
+            results[name]["peak_cuda_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "results": results,
+        "process_peak_rss_mb": peak_rss_mb(),
+    }
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare(current, baseline):
+    # Ratios are current / baseline: > 1 is slower for *_s/*_ms/*_mb metrics
+    # and faster for *_per_s metrics.
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    for report, flat in ((current, now), (baseline, before)):
+        if "process_peak_rss_mb" in report:
+            flat["process_peak_rss_mb"] = report["process_peak_rss_mb"]
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for key in sorted(now.keys() & before.keys()):
+        ratio = now[key] / before[key] if before[key] else float("nan")
+        print(f"{key:<40} {before[key]:>12.4g} {now[key]:>12.4g} {ratio:>8.3f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the occupancy pipeline on synthetic lots.")
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=512)
+    parser.add_argument("--threshold", type=float, default=75)
+    parser.add_argument("--window-size", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--train-steps", type=int, default=8)
+    parser.add_argument("--inference-steps", type=int, default=100)
+    parser.add_argument("--feature-frames", type=int, default=100)
+    parser.add_argument("--diff-frames", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--only", default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    for name, result in report["results"].items():
+        print(f"{name}: " + ", ".join(f"{k}={v:.4g}" for k, v in flatten(result).items()))
+    print(f"process peak RSS: {report['process_peak_rss_mb']:.1f} MB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
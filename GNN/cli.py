@@ -0,0 +1,42 @@
+import sys
+import argparse
+import importlib
+
+# One entry point for every stage: python GNN <command> [args] (or
+# python cli.py <command> from this directory). Each command's module is only
+# imported once it is picked, so preprocessing commands start without loading
+# torch or torch_geometric, and every stage stays importable from Python with
+# its own main(argv) and library functions.
+COMMANDS = {
+    "ingest": ("utils.ingest", "Label and store every DJI flight under a data root in parallel"),
+    "label": ("utils.create_graphs", "Label one flight's frames into a snapshot store"),
+    "build-dataset": ("utils.geometric_graphs", "Update the dataset manifest and graph cache of a data root"),
+    "train": ("train", "Train the occupancy forecaster"),
+    "evaluate": ("evaluate", "Evaluate a checkpoint on the test split"),
+    "serve": ("serve", "Serve live forecasts over HTTP"),
+    "bench": ("bench", "Benchmark the pipeline on synthetic lots"),
+    "export": ("export", "Export a per-lot TorchScript/ONNX forecaster"),
+    "sweep": ("sweep", "Run a parallel hyperparameter sweep"),
+    "mask": ("utils.create_mask", "Click parking spots to create a lot's node table"),
+    "annotate": ("utils.init_graph", "Toggle spot occupancy on a lot image by hand"),
+    "interpolate": ("utils.create_synthetic_graphs", "Interpolate the seconds between a store's keyframes"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="brainwave", description="BrainWave parking occupancy pipeline.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<15}{help_text}" for name, (_, help_text) in COMMANDS.items())
+              + "\n\nRun 'brainwave <command> -h' for a command's options.",
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    module_name, _ = COMMANDS[args.command]
+    # Usage lines of the command's own parser read "brainwave <command> ...".
+    sys.argv[0] = f"{parser.prog} {args.command}"
+    return importlib.import_module(module_name).main(args.args)
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,249 @@
-import torch
+import os
 import json
+import argparse
+import numpy as np
+import torch
 from tqdm import tqdm
+from model.GNN import carry_state, model_from_state_dict
+from utils import profiling
+from utils.checkpointing import load_model_state
+from utils.geometric_graphs import build_dynamic_dataset
+from utils.lots import LotRegistry
+from utils.partition import ClusterPredictor
+
+class PredictionWriter:
+    # Streams per-frame predictions to disk in chunks instead of holding them
+    # all in memory. "npys" appends (frame ids, float16 probabilities, uint8
+    # targets) .npy records to one stream file, read back with
+    # read_predictions (np.load alone only sees the first record); "jsonl"
+    # writes one compact JSON object per frame; "json" writes the original
+    # {"frame_<i>": {probabilities, predictions, targets, frame_accuracy}}
+    # object, one frame at a time.
+
+    def __init__(self, output_path, chunk_size=64):
+        ext = os.path.splitext(output_path)[1].lower()
+        if ext not in (".npys", ".jsonl", ".json"):
+            raise ValueError(f"Unsupported prediction format {ext!r}; use .npys, .jsonl or .json")
+        self.format = ext[1:]
+        self.chunk_size = chunk_size
+        self._file = open(output_path, "wb" if self.format == "npys" else "w")
+        if self.format == "json":
+            self._file.write("{")
+        self._written = 0
+        self._frames, self._probs, self._targets = [], [], []
+
+    def write(self, frame_idx, probs, targets):
+        self._frames.append(np.full(probs.shape[0], frame_idx, dtype=np.int32))
+        self._probs.append(probs)
+        self._targets.append(targets)
+        if len(self._probs) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._probs:
+            return
+        probs = torch.cat(self._probs).cpu().numpy()
+        targets = torch.cat(self._targets).cpu().numpy()
+
+        if self.format == "npys":
+            np.save(self._file, np.concatenate(self._frames))
+            np.save(self._file, probs.astype(np.float16))
+            np.save(self._file, targets.astype(np.uint8))
+        elif self.format == "json":
+            offset = 0
+            for frames in self._frames:
+                rows = slice(offset, offset + len(frames))
+                preds = (probs[rows] > 0.5).astype(int)
+                record = {
+                    "probabilities": probs[rows].astype(np.float64).tolist(),
+                    "predictions": preds.tolist(),
+                    "targets": targets[rows].astype(int).tolist(),
+                    "frame_accuracy": round(float((preds == targets[rows].round()).mean()), 3),
+                }
+                separator = "," if self._written else ""
+                self._file.write(f'{separator}"frame_{int(frames[0])}":' + json.dumps(record))
+                self._written += 1
+                offset += len(frames)
+        else:
+            offset = 0
+            for frames in self._frames:
+                rows = slice(offset, offset + len(frames))
+                record = {
+                    "frame": int(frames[0]),
+                    "probabilities": np.round(probs[rows].astype(np.float64), 4).tolist(),
+                    "targets": targets[rows].astype(int).tolist(),
+                }
+                self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                offset += len(frames)
+
+        self._frames, self._probs, self._targets = [], [], []
+
+    def close(self):
+        self.flush()
+        if self.format == "json":
+            self._file.write("}")
+        self._file.close()
+
+def read_predictions(path):
+    # (frame ids, probabilities, targets) of a .npys prediction stream.
+    frames, probs, targets = [], [], []
+    with open(path, "rb") as f:
+        while f.peek(1):
+            frames.append(np.load(f))
+            probs.append(np.load(f))
+            targets.append(np.load(f))
+    return np.concatenate(frames), np.concatenate(probs), np.concatenate(targets)
 
-def evaluate_and_save_predictions(dataset, model, device, output_path="val_predictions.json"):
+def local_node_index(snapshot):
+    # Position of every row inside its own graph of the batched snapshot, so
+    # per-node metrics line up across batches. Computed before the snapshot is
+    # moved to the device so sizing the accumulators never forces a sync.
+    num_nodes = snapshot.x.shape[0]
+    batch = getattr(snapshot, "batch", None)
+    if batch is None:
+        return torch.arange(num_nodes)
+    counts = torch.bincount(batch)
+    ptr = torch.cumsum(counts, 0) - counts
+    return torch.arange(num_nodes) - ptr[batch]
+
+def summarize_metrics(tp, fp, fn, tn, brier, node_correct, node_total):
+    total = tp + fp + fn + tn
+    precision = tp / (tp + fp).clamp(min=1)
+    recall = tp / (tp + fn).clamp(min=1)
+    f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+    return {
+        "accuracy": ((tp + tn) / total.clamp(min=1)).tolist(),
+        "precision": precision.tolist(),
+        "recall": recall.tolist(),
+        "f1": f1.tolist(),
+        "brier": (brier / total.clamp(min=1)).tolist(),
+        "per_node_accuracy": (node_correct / node_total.clamp(min=1)).T.tolist(),
+    }
+
+def evaluate_and_save_predictions(dataset, model, device, output_path="val_predictions.npys", stateful=False,
+                                 horizons=None, chunk_size=64):
     model.eval()
-    predictions = {}
+    state = previous_batch = None
+    writer = PredictionWriter(output_path, chunk_size=chunk_size)
 
-    total_correct = 0
-    total_preds = 0
+    # Confusion counts, Brier sums and per-node hits stay on the device and are
+    # only synchronised once at the end; columns are horizons (1 for the
+    # single-step head).
+    tp = fp = fn = tn = brier = None
+    node_correct = node_total = None
 
     with torch.no_grad():
         for idx, snapshot in enumerate(tqdm(dataset)):
-            snapshot.to(device)
+            node_index = local_node_index(snapshot)
+            num_nodes = int(node_index.max()) + 1
+            with profiling.span("host_to_device"):
+                node_index = node_index.to(device)
+                snapshot = snapshot.to(device)
+
+            with profiling.span("inference"):
+                if stateful:
+                    state = carry_state(state, previous_batch, snapshot)
+                    previous_batch = snapshot.batch
+                    probs, state = model.step(snapshot, state)
+                else:
+                    probs, _ = model.step(snapshot)
+
+            targets = snapshot.y.float()
+            with profiling.span("write_predictions"):
+                writer.write(idx, probs, targets)
+            profiling.count("eval_batches")
+
+            probs_2d = probs.reshape(probs.shape[0], -1)
+            targets_2d = targets.reshape(targets.shape[0], -1)
+            preds = probs_2d > 0.5
+            positives = targets_2d > 0.5
+
+            if tp is None:
+                zeros = torch.zeros(probs_2d.shape[1], device=probs.device)
+                tp, fp, fn, tn, brier = (zeros.clone() for _ in range(5))
+                node_correct = torch.zeros(0, probs_2d.shape[1], device=probs.device)
+                node_total = torch.zeros(0, 1, device=probs.device)
+
+            tp += (preds & positives).sum(dim=0)
+            fp += (preds & ~positives).sum(dim=0)
+            fn += (~preds & positives).sum(dim=0)
+            tn += (~preds & ~positives).sum(dim=0)
+            brier += ((probs_2d - targets_2d) ** 2).sum(dim=0)
+
+            if num_nodes > node_correct.shape[0]:
+                grow = num_nodes - node_correct.shape[0]
+                node_correct = torch.cat([node_correct, node_correct.new_zeros(grow, node_correct.shape[1])])
+                node_total = torch.cat([node_total, node_total.new_zeros(grow, 1)])
+            node_correct.index_add_(0, node_index, (preds == positives).float())
+            node_total.index_add_(0, node_index, torch.ones(len(node_index), 1, device=probs.device))
+
+    with profiling.span("write_predictions"):
+        writer.close()
+    profiling.record_memory()
+
+    metrics = summarize_metrics(tp, fp, fn, tn, brier, node_correct, node_total)
+    overall_accuracy = float(((tp + tn).sum() / (tp + fp + fn + tn).sum().clamp(min=1)).item())
+    metrics["overall_accuracy"] = overall_accuracy
+    if horizons is not None:
+        metrics["horizons"] = list(horizons)
 
-            out = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr)
-            probs = torch.sigmoid(out)
-            preds = (probs > 0.5).long()
+    with open(os.path.splitext(output_path)[0] + "_metrics.json", "w") as f:
+        json.dump(metrics, f)
 
-            targets = snapshot.y.long()
+    print(f"Accuracy: {overall_accuracy:.4f}")
+    labels = [f"+{h} min" for h in horizons] if horizons is not None else [""] * len(metrics["accuracy"])
+    for i, label in enumerate(labels):
+        prefix = f"  {label}: " if label else ""
+        print(f"{prefix}Accuracy {metrics['accuracy'][i]:.4f} | Precision {metrics['precision'][i]:.4f} | "
+              f"Recall {metrics['recall'][i]:.4f} | F1 {metrics['f1'][i]:.4f} | Brier {metrics['brier'][i]:.4f}")
 
-            correct = (preds == targets).sum().item()
-            total = targets.numel()
-            acc = correct / total
+    return metrics
 
-            total_correct += correct
-            total_preds += total
+def evaluate_checkpoint(checkpoint_path, data_root="Data", output_path="val_predictions.npys", dist_threshold=75,
+                        batch_size=32, stateful=False, horizons=None, cluster_size=None, halo_hops=2, device="cpu",
+                        profile=False):
+    # Scores a saved model on the test split of data_root, the same split and
+    # inference path train.py evaluates on at the end of a run.
+    if profile:
+        profiling.enable()
+    device = torch.device(device)
+    model = model_from_state_dict(load_model_state(checkpoint_path)).to(device)
+    if (model.horizons or 1) != (len(horizons) if horizons else 1):
+        raise ValueError(f"Checkpoint has {model.horizons or 1} output(s); pass the horizons it was trained with")
 
-            predictions[f"frame_{idx}"] = {
-                "probabilities": probs.cpu().tolist(),
-                "predictions": preds.cpu().tolist(),
-                "targets": targets.cpu().tolist(),
-                "frame_accuracy": round(acc, 3),
-            }
+    registry = LotRegistry()
+    _, _, test_dataset = build_dynamic_dataset(
+        data_root, batch_size=batch_size, dist_threshold=dist_threshold, lazy=True,
+        layout="lanes" if stateful else "sequential", horizons=horizons, registry=registry,
+    )
+    eval_model = model if cluster_size is None else ClusterPredictor(model, registry, dist_threshold, cluster_size,
+                                                                     halo_hops)
+    metrics = evaluate_and_save_predictions(test_dataset, eval_model, device, output_path=output_path,
+                                            stateful=stateful, horizons=horizons)
+    profiling.finish(trace_path="profile_trace.json", summary_path="profile_summary.json")
+    return metrics
 
-    overall_accuracy = round(total_correct / total_preds, 3)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a trained checkpoint on the test split of a data root.")
+    parser.add_argument("checkpoint")
+    parser.add_argument("data_root", nargs="?", default="Data")
+    parser.add_argument("--output", default="val_predictions.npys",
+                        help=".npys (stream read with evaluate.read_predictions), .jsonl or .json")
+    parser.add_argument("--dist-threshold", type=float, default=75)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--stateful", action="store_true")
+    parser.add_argument("--horizons", type=float, nargs="+", default=None)
+    parser.add_argument("--cluster-size", type=int, default=None, help="Stitch predictions from spatial clusters")
+    parser.add_argument("--halo-hops", type=int, default=2,
+                        help="Halo of each cluster (as in training); -1 for the exact receptive-field halo")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--profile", action="store_true", help="Write profile_trace.json and profile_summary.json")
+    args = parser.parse_args(argv)
 
-    with open(output_path, "w") as f:
-        json.dump(predictions, f, indent=2)
+    evaluate_checkpoint(args.checkpoint, args.data_root, args.output, dist_threshold=args.dist_threshold,
+                        batch_size=args.batch_size, stateful=args.stateful, horizons=args.horizons,
+                        cluster_size=args.cluster_size, halo_hops=None if args.halo_hops < 0 else args.halo_hops,
+                        device=args.device, profile=args.profile)
 
-    print(f"Accuracy: {overall_accuracy:.4f}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
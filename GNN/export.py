@@ -0,0 +1,181 @@
+import io
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from model.GNN import model_from_state_dict
+from model.inference import LotForecaster, quantize_forecaster
+from utils.checkpointing import load_model_state
+from utils.lots import LotRegistry
+from utils.snapshot_store import find_snapshot_stores, open_store
+
+FORMATS = ("torchscript", "onnx")
+
+def example_inputs(forecaster):
+    num_nodes = forecaster.static_features.shape[0]
+    return (
+        torch.zeros(num_nodes),
+        torch.tensor([1.7e9], dtype=torch.float64),
+        *(torch.zeros(num_nodes, size) for size in forecaster.state_sizes()),
+    )
+
+def artifact_metadata(forecaster, lot, dist_threshold, quantized):
+    # Everything the app needs to drive the artifact: input order, node order
+    # and the hidden state shapes to start from.
+    return {
+        "lot_id": lot.lot_id,
+        "node_ids": lot.nodes["node_id"].tolist(),
+        "num_nodes": lot.num_nodes,
+        "state_sizes": forecaster.state_sizes(),
+        "outputs": forecaster.linear.out_features if forecaster.multi_horizon else 1,
+        "include_occupancy": forecaster.include_occupancy,
+        "dist_threshold": dist_threshold,
+        "quantized": quantized,
+        "inputs": ["occupancy", "timestamp", "h1", "h2", "h3"],
+        "outputs_order": ["probabilities", "h1", "h2", "h3"],
+    }
+
+def script_forecaster(forecaster):
+    return torch.jit.script(forecaster.eval())
+
+def save_torchscript(forecaster, path, metadata):
+    scripted = script_forecaster(forecaster)
+    torch.jit.save(scripted, path, _extra_files={"metadata.json": json.dumps(metadata)})
+    return scripted
+
+def save_onnx(forecaster, path, metadata):
+    # Dynamically quantized Linear layers have no ONNX lowering; quantize the
+    # ONNX graph with the runtime's own tooling instead.
+    if metadata["quantized"]:
+        raise ValueError("int8 dynamic quantization is only supported for TorchScript export")
+    torch.onnx.export(
+        forecaster.eval(), example_inputs(forecaster), path, dynamo=False,
+        input_names=metadata["inputs"], output_names=metadata["outputs_order"],
+    )
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+def load_artifact(path):
+    extra_files = {"metadata.json": ""}
+    module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+    return module, json.loads(extra_files["metadata.json"])
+
+def build_forecaster(checkpoint_path, data_root, lot_id=None, dist_threshold=75):
+    registry = LotRegistry()
+    stores = [open_store(path) for path in find_snapshot_stores(data_root)]
+    for store in stores:
+        registry.register_store(store)
+    if not len(registry):
+        raise FileNotFoundError(f"No snapshot stores under {data_root}")
+    lot = registry[lot_id if lot_id is not None else registry.lot_ids[0]]
+    model = model_from_state_dict(load_model_state(checkpoint_path))
+    lot_stores = [store for store in stores if registry.register_store(store) is lot]
+    return LotForecaster(model, lot, dist_threshold), lot, lot_stores
+
+def export_forecaster(forecaster, lot, output_path, fmt="torchscript", quantize=False, dist_threshold=75):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; choose from {', '.join(FORMATS)}")
+    module = quantize_forecaster(forecaster) if quantize else forecaster
+    metadata = artifact_metadata(forecaster, lot, dist_threshold, quantize)
+    if fmt == "onnx":
+        save_onnx(module, output_path, metadata)
+    else:
+        save_torchscript(module, output_path, metadata)
+    print(f"Exported {'int8' if quantize else 'fp32'} {fmt} forecaster for lot {lot.lot_id!r} to {output_path}")
+    return module
+
+def serialized_mb(module):
+    buffer = io.BytesIO()
+    torch.jit.save(module, buffer)
+    return buffer.tell() / 2 ** 20
+
+def run_forecaster(module, occupancy, timestamps, state_sizes, warmup=5):
+    # Streams every frame through the artifact from a zero state, the way the
+    # app would, and times each step.
+    num_nodes = occupancy.shape[1]
+    state = [torch.zeros(num_nodes, size) for size in state_sizes]
+    inputs = [(torch.from_numpy(occupancy[t].astype(np.float32)), torch.tensor([timestamps[t]], dtype=torch.float64))
+              for t in range(len(occupancy))]
+
+    with torch.inference_mode():
+        for x, ts in inputs[:warmup]:
+            module(x, ts, *[torch.zeros(num_nodes, size) for size in state_sizes])
+
+        probs, latencies = [], []
+        for x, ts in inputs:
+            start = time.perf_counter()
+            out, *state = module(x, ts, *state)
+            latencies.append(time.perf_counter() - start)
+            probs.append(out.numpy())
+    return np.stack(probs), np.asarray(latencies) * 1000.0
+
+def compare_forecasters(forecaster, store, steps=200):
+    # fp32 vs int8 TorchScript on the CPU over one recording of the lot:
+    # per-step latency, accuracy against the recorded occupancy (single-step
+    # head) and how far the quantized probabilities drift from fp32.
+    num_frames = min(len(store), steps)
+    occupancy = store.occupancy_window(0, num_frames)
+    timestamps = np.nan_to_num(store.timestamps[:num_frames])
+    variants = {"fp32": script_forecaster(forecaster), "int8": script_forecaster(quantize_forecaster(forecaster))}
+
+    results, probs = {}, {}
+    for name, module in variants.items():
+        probs[name], latencies = run_forecaster(module, occupancy, timestamps, forecaster.state_sizes())
+        results[name] = {
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "size_mb": serialized_mb(module),
+        }
+        if not forecaster.multi_horizon:
+            results[name]["accuracy"] = float(((probs[name] > 0.5) == occupancy.astype(bool)).mean())
+
+    diff = np.abs(probs["int8"] - probs["fp32"])
+    results["int8_vs_fp32"] = {
+        "steps": num_frames,
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "agreement": float(((probs["int8"] > 0.5) == (probs["fp32"] > 0.5)).mean()),
+        "speedup": results["fp32"]["p50_ms"] / results["int8"]["p50_ms"],
+    }
+    return results
+
+def print_comparison(results):
+    print(f"{'variant':<8} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'size MB':>10} {'accuracy':>10}")
+    for name in ("fp32", "int8"):
+        r = results[name]
+        accuracy = f"{r['accuracy']:.4f}" if "accuracy" in r else "-"
+        print(f"{name:<8} {r['mean_ms']:>10.3f} {r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['size_mb']:>10.2f} "
+              f"{accuracy:>10}")
+    d = results["int8_vs_fp32"]
+    print(f"int8 vs fp32 over {d['steps']} steps: max |dp| {d['max_abs_diff']:.4f}, mean |dp| "
+          f"{d['mean_abs_diff']:.5f}, agreement {d['agreement']:.4f}, p50 speedup {d['speedup']:.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a trained checkpoint as a self-contained per-lot forecaster.")
+    parser.add_argument("checkpoint")
+    parser.add_argument("data_root", help="Root with the lot's snapshot stores")
+    parser.add_argument("--lot-id", default=None, help="Lot to bake in (default: the first one found)")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--format", choices=FORMATS, default="torchscript")
+    parser.add_argument("--quantize", action="store_true", help="int8 dynamic quantization of the Linear layers")
+    parser.add_argument("--dist-threshold", type=float, default=75)
+    parser.add_argument("--benchmark", action="store_true", help="Compare fp32 and int8 accuracy/latency on the CPU")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    forecaster, lot, stores = build_forecaster(args.checkpoint, args.data_root, args.lot_id, args.dist_threshold)
+    suffix = ".onnx" if args.format == "onnx" else ".pt"
+    output = args.output or f"forecaster_{lot.lot_id}{'_int8' if args.quantize else ''}{suffix}"
+    export_forecaster(forecaster, lot, output, args.format, args.quantize, args.dist_threshold)
+
+    if args.benchmark:
+        print_comparison(compare_forecasters(forecaster, stores[0], args.steps))
+
+if __name__ == "__main__":
+    main()
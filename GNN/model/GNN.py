@@ -1,23 +1,98 @@
 import torch
-from torch_geometric_temporal.nn.recurrent import GConvGRU
 import torch.nn.functional as F
+from model.chebyshev import CachedGConvGRU, graph_operator
 
 class TemporalForecastingGNN(torch.nn.Module):
-    def __init__(self, node_features, hidden_features=256):
+    def __init__(self, node_features, hidden_features=256, horizons=None):
         super().__init__()
-        self.recurrent1 = GConvGRU(in_channels=node_features, out_channels=hidden_features, K=5)
-        self.recurrent2 = GConvGRU(in_channels=hidden_features, out_channels=hidden_features // 2, K=5)
-        self.recurrent3 = GConvGRU(in_channels=hidden_features // 2, out_channels=hidden_features // 4, K=5)
-        self.linear = torch.nn.Linear(hidden_features // 4, 1)
-
-    def forward(self, x, edge_index, edge_weight):
-        h = self.recurrent1(x, edge_index, edge_weight)
-        h = F.relu(h)
+        self.horizons = horizons
+        self.recurrent1 = CachedGConvGRU(in_channels=node_features, out_channels=hidden_features, K=5)
+        self.recurrent2 = CachedGConvGRU(in_channels=hidden_features, out_channels=hidden_features // 2, K=5)
+        self.recurrent3 = CachedGConvGRU(in_channels=hidden_features // 2, out_channels=hidden_features // 4, K=5)
+        self.linear = torch.nn.Linear(hidden_features // 4, horizons or 1)
+        self._operator = None
+
+    def forward(self, x, edge_index, edge_weight, state=None, return_state=False):
+        # state holds the per-layer GConvGRU hidden states from the previous
+        # snapshot; None (or a node-count mismatch) starts from zeros.
+        h1, h2, h3 = reset_state_if_needed(state, x.shape[0])
+
+        # The scaled Laplacian is built once per topology and shared by all
+        # three layers and their gates.
+        self._operator = operator = graph_operator(edge_index, edge_weight, x.shape[0], self._operator)
+
+        h1 = self.recurrent1(x, edge_index, edge_weight, H=h1, operator=operator)
+        h = F.relu(h1)
         h = F.dropout(h, training=self.training)
-        h = self.recurrent2(h, edge_index, edge_weight)
-        h = F.relu(h)
+        h2 = self.recurrent2(h, edge_index, edge_weight, H=h2, operator=operator)
+        h = F.relu(h2)
         h = F.dropout(h, training=self.training)
-        h = self.recurrent3(h, edge_index, edge_weight)
-        h = F.relu(h)
+        h3 = self.recurrent3(h, edge_index, edge_weight, H=h3, operator=operator)
+        h = F.relu(h3)
         h = F.dropout(h, training=self.training)
-        return self.linear(h).squeeze(-1)
\ No newline at end of file
+        # One logit per node, or (num_nodes, horizons) logits in multi-horizon mode.
+        out = self.linear(h)
+        if self.horizons is None:
+            out = out.squeeze(-1)
+
+        if return_state:
+            return out, (h1, h2, h3)
+        return out
+
+    def __getstate__(self):
+        # The cached sparse operator is derived data and cannot be copied.
+        state = self.__dict__.copy()
+        state["_operator"] = None
+        return state
+
+    @torch.no_grad()
+    def step(self, snapshot, state=None):
+        out, state = self(snapshot.x, snapshot.edge_index, snapshot.edge_attr, state=state, return_state=True)
+        return torch.sigmoid(out), state
+
+def compile_recurrent_layers(model, **compile_kwargs):
+    # Compiles the GConvGRU stack in place. Module.compile keeps parameter
+    # names unchanged, so checkpoints stay loadable by uncompiled models.
+    compile_kwargs.setdefault("dynamic", True)
+    for layer in (model.recurrent1, model.recurrent2, model.recurrent3):
+        layer.compile(**compile_kwargs)
+    return model
+
+def carry_state(state, previous_batch, snapshot):
+    # Hidden state for the next lanes batch (see LazyTemporalDataset): graph g
+    # keeps its rows from graph g of the previous batch unless snapshot.reset
+    # marks its lane as starting a new recording, which starts from zeros.
+    # Rows are regathered per graph because a lane that moved to another lot
+    # changes its node count. Per-partition dict states (ClusterPredictor)
+    # handle reset themselves and pass through.
+    reset = getattr(snapshot, "reset", None)
+    if not isinstance(state, tuple) or reset is None or previous_batch is None or not bool(reset.any()):
+        return state
+    batch = snapshot.batch
+    num_graphs = len(reset)
+    previous_counts = torch.bincount(previous_batch, minlength=num_graphs)
+    counts = torch.bincount(batch, minlength=num_graphs)
+    local = torch.arange(len(batch), device=batch.device) - (torch.cumsum(counts, 0) - counts)[batch]
+    source = ((torch.cumsum(previous_counts, 0) - previous_counts)[batch] + local).clamp(max=state[0].shape[0] - 1)
+    keep = (~reset.to(batch.device))[batch].unsqueeze(-1)
+    return tuple(torch.where(keep, h[source], torch.zeros((), dtype=h.dtype, device=h.device)) for h in state)
+
+def reset_state_if_needed(state, num_nodes):
+    if state is None or state[0].shape[0] != num_nodes:
+        return None, None, None
+    return state
+
+def detach_state(state):
+    if state is None:
+        return None
+    return tuple(h.detach() for h in state)
+
+def model_from_state_dict(state_dict):
+    # Rebuilds a TemporalForecastingGNN with the sizes a saved state dict was
+    # trained with. A single output column is read as the single-step head.
+    node_features = state_dict["recurrent1.conv_x_z.lins.0.weight"].shape[1]
+    hidden_features = state_dict["recurrent1.conv_x_z.lins.0.weight"].shape[0]
+    outputs = state_dict["linear.weight"].shape[0]
+    model = TemporalForecastingGNN(node_features, hidden_features, horizons=outputs if outputs > 1 else None)
+    model.load_state_dict(state_dict)
+    return model
@@ -0,0 +1,92 @@
+import torch
+import torch.nn.functional as F
+from torch_geometric_temporal.nn.recurrent import GConvGRU
+
+class GraphOperator:
+    # The scaled Laplacian ChebConv builds internally on every call. With sym
+    # normalisation and ChebConv's default lambda_max of 2 it reduces to
+    # L_hat = -D^-1/2 A D^-1/2 (self-loops removed), stored here once as a
+    # sparse matrix so every layer, gate and Chebyshev order reuses it.
+
+    def __init__(self, edge_index, edge_weight, num_nodes):
+        self.edge_index = edge_index
+        self.edge_weight = edge_weight
+        self.num_nodes = num_nodes
+
+        source, target = edge_index[0], edge_index[1]
+        weight = edge_weight if edge_weight is not None else torch.ones(source.shape[0], device=source.device)
+        keep = source != target
+        source, target, weight = source[keep], target[keep], weight[keep].float()
+
+        degree = torch.zeros(num_nodes, device=weight.device).index_add_(0, source, weight)
+        degree_inv_sqrt = degree.pow(-0.5)
+        degree_inv_sqrt.masked_fill_(torch.isinf(degree_inv_sqrt), 0)
+        values = -degree_inv_sqrt[source] * weight * degree_inv_sqrt[target]
+
+        # Messages flow source -> target, so row = target, column = source.
+        self.matrix = torch.sparse_coo_tensor(
+            torch.stack([target, source]), values, (num_nodes, num_nodes), check_invariants=False
+        ).coalesce()
+
+    def matches(self, edge_index, edge_weight, num_nodes):
+        return edge_index is self.edge_index and edge_weight is self.edge_weight and num_nodes == self.num_nodes
+
+    def propagate(self, x):
+        # Sparse matmul stays in fp32 under autocast; the dense gate
+        # projections are where reduced precision pays off.
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            return torch.sparse.mm(self.matrix, x.float()).to(x.dtype)
+
+    def chebyshev_basis(self, x, K):
+        # [T_0 x, ..., T_{K-1} x] concatenated along features, the order the
+        # fused gate weights below expect.
+        basis = [x]
+        if K > 1:
+            basis.append(self.propagate(x))
+        for _ in range(2, K):
+            basis.append(2.0 * self.propagate(basis[-1]) - basis[-2])
+        return torch.cat(basis, dim=1)
+
+def graph_operator(edge_index, edge_weight, num_nodes, cached=None):
+    # Reuses cached when it was built from these exact tensors: the dataset
+    # and server memoize their batched topology, so a batch of the same lots
+    # as the previous one hands back the same tensors.
+    if cached is not None and cached.matches(edge_index, edge_weight, num_nodes):
+        return cached
+    return GraphOperator(edge_index, edge_weight, num_nodes)
+
+def fused_cheb_weights(convs):
+    # Stacks several ChebConvs that read the same input into one (K*in,
+    # n*out) projection of the shared Chebyshev basis.
+    weight = torch.cat([torch.cat([lin.weight for lin in conv.lins], dim=1) for conv in convs], dim=0)
+    bias = torch.cat([conv.bias for conv in convs]) if convs[0].bias is not None else None
+    return weight, bias
+
+class CachedGConvGRU(GConvGRU):
+    # GConvGRU with the same parameters (and state_dict keys) that takes a
+    # precomputed GraphOperator. The Chebyshev basis of X is shared by the
+    # three input convolutions and that of H by the update and reset gates,
+    # so each step expands three bases instead of six, and each group of
+    # gates is one matmul.
+
+    def forward(self, X, edge_index, edge_weight=None, H=None, lambda_max=None, operator=None):
+        if self.normalization != "sym" or lambda_max is not None:
+            return super().forward(X, edge_index, edge_weight, H, lambda_max)
+        if operator is None:
+            operator = GraphOperator(edge_index, edge_weight, X.shape[0])
+
+        H = self._set_hidden_state(X, H)
+        out = self.out_channels
+
+        weight, bias = fused_cheb_weights([self.conv_x_z, self.conv_x_r, self.conv_x_h])
+        x_gates = F.linear(operator.chebyshev_basis(X, self.K), weight, bias)
+
+        weight, bias = fused_cheb_weights([self.conv_h_z, self.conv_h_r])
+        h_gates = F.linear(operator.chebyshev_basis(H, self.K), weight, bias)
+
+        Z = torch.sigmoid(x_gates[:, :out] + h_gates[:, :out])
+        R = torch.sigmoid(x_gates[:, out:2 * out] + h_gates[:, out:])
+
+        weight, bias = fused_cheb_weights([self.conv_h_h])
+        H_tilde = torch.tanh(x_gates[:, 2 * out:] + F.linear(operator.chebyshev_basis(H * R, self.K), weight, bias))
+        return Z * H + (1 - Z) * H_tilde
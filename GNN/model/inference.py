@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from model.chebyshev import GraphOperator, fused_cheb_weights
+
+def fused_linear(convs):
+    weight, bias = fused_cheb_weights(convs)
+    linear = torch.nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None)
+    with torch.no_grad():
+        linear.weight.copy_(weight)
+        if bias is not None:
+            linear.bias.copy_(bias)
+    return linear
+
+class InferenceGConvGRU(torch.nn.Module):
+    # CachedGConvGRU as three plain Linear layers over the Chebyshev bases of
+    # X, H and H * R, with the graph operator passed in as a dense matrix.
+    # Nothing here depends on torch_geometric, so it scripts, exports to ONNX
+    # and its Linear layers can be dynamically quantized.
+
+    def __init__(self, layer):
+        super().__init__()
+        self.K = layer.K
+        self.out_channels = layer.out_channels
+        self.x_gates = fused_linear([layer.conv_x_z, layer.conv_x_r, layer.conv_x_h])
+        self.h_gates = fused_linear([layer.conv_h_z, layer.conv_h_r])
+        self.h_candidate = fused_linear([layer.conv_h_h])
+
+    def basis(self, x, operator):
+        basis = [x]
+        if self.K > 1:
+            basis.append(operator @ x)
+        for _ in range(2, self.K):
+            basis.append(2.0 * (operator @ basis[-1]) - basis[-2])
+        return torch.cat(basis, dim=1)
+
+    def forward(self, x, h, operator):
+        out = self.out_channels
+        x_gates = self.x_gates(self.basis(x, operator))
+        h_gates = self.h_gates(self.basis(h, operator))
+        z = torch.sigmoid(x_gates[:, :out] + h_gates[:, :out])
+        r = torch.sigmoid(x_gates[:, out:2 * out] + h_gates[:, out:])
+        h_tilde = torch.tanh(x_gates[:, 2 * out:] + self.h_candidate(self.basis(h * r, operator)))
+        return z * h + (1 - z) * h_tilde
+
+class LotForecaster(torch.nn.Module):
+    # A trained TemporalForecastingGNN specialised to one lot: the lot's
+    # scaled Laplacian and static node features are baked in as buffers, so
+    # one live step only needs the observed occupancy (ordered by node_id),
+    # the frame timestamp (seconds since the epoch, float64) and the previous
+    # hidden states (zeros for the first frame). Returns the probabilities
+    # and the new hidden states.
+
+    def __init__(self, model, lot, dist_threshold=75):
+        super().__init__()
+        model = model.cpu().eval()
+        # Lot arrays may be read-only memory maps of the graph cache or store,
+        # so buffers get copies of their own rather than views into them.
+        edge_index, edge_weight = lot.topology(dist_threshold)
+        operator = GraphOperator(torch.tensor(np.asarray(edge_index), dtype=torch.long),
+                                 torch.tensor(np.asarray(edge_weight), dtype=torch.float32), lot.num_nodes)
+        self.register_buffer("operator", operator.matrix.to_dense())
+        self.register_buffer("static_features", torch.tensor(np.asarray(lot.static_features), dtype=torch.float32))
+        self.include_occupancy = model.recurrent1.in_channels == 5
+        self.multi_horizon = model.horizons is not None
+        self.recurrent1 = InferenceGConvGRU(model.recurrent1)
+        self.recurrent2 = InferenceGConvGRU(model.recurrent2)
+        self.recurrent3 = InferenceGConvGRU(model.recurrent3)
+        self.linear = torch.nn.Linear(model.linear.in_features, model.linear.out_features)
+        self.linear.load_state_dict(model.linear.state_dict())
+
+    def state_sizes(self):
+        return [self.recurrent1.out_channels, self.recurrent2.out_channels, self.recurrent3.out_channels]
+
+    def features(self, occupancy, timestamp):
+        normalized_time = torch.remainder(timestamp, 86400.0) / 86400.0
+        time_features = torch.nan_to_num(torch.stack([
+            torch.sin(2 * torch.pi * normalized_time), torch.cos(2 * torch.pi * normalized_time),
+        ], dim=-1).float()).reshape(1, 2).expand(self.static_features.shape[0], 2)
+        columns = [self.static_features, time_features]
+        if self.include_occupancy:
+            columns.append(occupancy.reshape(-1, 1).float())
+        return torch.cat(columns, dim=1)
+
+    def forward(self, occupancy, timestamp, h1, h2, h3):
+        x = self.features(occupancy, timestamp)
+        h1 = self.recurrent1(x, h1, self.operator)
+        h2 = self.recurrent2(F.relu(h1), h2, self.operator)
+        h3 = self.recurrent3(F.relu(h2), h3, self.operator)
+        out = self.linear(F.relu(h3))
+        if not self.multi_horizon:
+            out = out.squeeze(-1)
+        return torch.sigmoid(out), h1, h2, h3
+
+def quantize_forecaster(forecaster):
+    # int8 weights for every Linear (gates and head), activations quantized on
+    # the fly; the graph propagation itself stays fp32.
+    return torch.ao.quantization.quantize_dynamic(forecaster, {torch.nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,342 @@
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from model.GNN import model_from_state_dict
+from utils.checkpointing import load_model_state
+from utils.lots import LotRegistry
+from utils.snapshot_store import find_snapshot_stores, open_store
+from utils.timestamps import compute_time_features
+
+class ForecastServer:
+    # Keeps one model, every lot's static features/topology and each lot's
+    # GConvGRU hidden state in memory. Concurrent predict() calls are gathered
+    # for up to max_wait_ms and run as one block-diagonal forward pass; a lot
+    # appears at most once per pass so its recurrent state advances in order.
+    # Single-step models without the occupancy feature only forecast from
+    # time of day and lot layout; their responses say occupancy_used=false.
+
+    def __init__(self, model, registry, device="cpu", dist_threshold=75, max_batch_size=32, max_wait_ms=2.0,
+                 latency_window=10000):
+        self.model = model.to(device).eval()
+        self.registry = registry
+        self.device = torch.device(device)
+        self.dist_threshold = dist_threshold
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.include_occupancy = model.recurrent1.in_channels == 5
+
+        self._states = {}
+        self._topology = {}
+        self._batch_topology = None
+        self._queue = None
+        self._pending = deque()
+        self._batcher = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+
+    def _lot_topology(self, lot):
+        if lot.lot_id not in self._topology:
+            edge_index, edge_weight = lot.topology(self.dist_threshold)
+            self._topology[lot.lot_id] = (
+                torch.as_tensor(np.array(edge_index), device=self.device),
+                torch.as_tensor(np.array(edge_weight), device=self.device),
+            )
+        return self._topology[lot.lot_id]
+
+    def _batched_topology(self, lots):
+        # Block-diagonal topology for one pass, memoized on its lot ids like
+        # LazyTemporalDataset._batch_topology: repeating a batch hands back the
+        # same tensors, so the model's cached graph operator is reused.
+        key = tuple(lot.lot_id for lot in lots)
+        if self._batch_topology is None or self._batch_topology[0] != key:
+            edge_index, edge_weight, offset = [], [], 0
+            for lot in lots:
+                ei, ew = self._lot_topology(lot)
+                edge_index.append(ei + offset)
+                edge_weight.append(ew)
+                offset += lot.num_nodes
+            self._batch_topology = (key, torch.cat(edge_index, dim=1), torch.cat(edge_weight))
+        return self._batch_topology[1:]
+
+    def _features(self, lot, occupancy, timestamp):
+        features = np.empty((lot.num_nodes, 5 if self.include_occupancy else 4), dtype=np.float32)
+        features[:, :2] = lot.static_features
+        features[:, 2:4] = compute_time_features([timestamp])[0]
+        if self.include_occupancy:
+            features[:, 4] = occupancy
+        return features
+
+    def _zero_state(self, num_nodes):
+        return tuple(
+            torch.zeros(num_nodes, layer.out_channels, device=self.device)
+            for layer in (self.model.recurrent1, self.model.recurrent2, self.model.recurrent3)
+        )
+
+    def _forward(self, requests):
+        x, state, sizes = [], [], []
+        for lot, features, _ in requests:
+            x.append(torch.from_numpy(features))
+            state.append(self._states.get(lot.lot_id) or self._zero_state(lot.num_nodes))
+            sizes.append(lot.num_nodes)
+        edge_index, edge_weight = self._batched_topology([lot for lot, _, _ in requests])
+
+        state = tuple(torch.cat(layer) for layer in zip(*state))
+        with torch.inference_mode():
+            out, new_state = self.model(torch.cat(x).to(self.device), edge_index, edge_weight, state=state,
+                                        return_state=True)
+            probs = torch.sigmoid(out).cpu().numpy()
+
+        bounds = np.cumsum([0] + sizes)
+        for i, (lot, _, _) in enumerate(requests):
+            self._states[lot.lot_id] = tuple(h[bounds[i]:bounds[i + 1]] for h in new_state)
+        return np.split(probs, bounds[1:-1])
+
+    async def _collect(self):
+        # Requests for a lot already in the batch wait in _pending, which is
+        # always drained before the queue, so each lot's frames keep their
+        # arrival order across batches.
+        requests = [self._pending.popleft() if self._pending else await self._queue.get()]
+        lots = {requests[0][0].lot_id}
+        deferred = deque()
+        while self._pending:
+            request = self._pending.popleft()
+            if request[0].lot_id in lots or len(requests) >= self.max_batch_size:
+                deferred.append(request)
+            else:
+                lots.add(request[0].lot_id)
+                requests.append(request)
+        self._pending = deferred
+
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if request[0].lot_id in lots:
+                self._pending.append(request)
+            else:
+                lots.add(request[0].lot_id)
+                requests.append(request)
+        return requests
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = await self._collect()
+            try:
+                results = await loop.run_in_executor(self._executor, self._forward, requests)
+            except Exception as e:
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_sizes.append(len(requests))
+            for (_, _, future), probs in zip(requests, results):
+                if not future.done():
+                    future.set_result(probs)
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._pending.clear()
+        self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def stop(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def predict(self, lot_id, occupancy=None, timestamp=None):
+        start = time.perf_counter()
+        lot = self.registry[lot_id]
+        if occupancy is None:
+            if self.include_occupancy:
+                raise ValueError("This model forecasts from the observed occupancy; send occupancy")
+        else:
+            occupancy = np.asarray(occupancy, dtype=np.float32)
+            if occupancy.shape != (lot.num_nodes,):
+                raise ValueError(f"Lot {lot_id!r} has {lot.num_nodes} spots, got {occupancy.shape[0]} observations")
+        timestamp = time.time() if timestamp is None else timestamp
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((lot, self._features(lot, occupancy, timestamp), future))
+        probs = await future
+        self.latencies.append(time.perf_counter() - start)
+        return probs
+
+    def reset(self, lot_id=None):
+        if lot_id is None:
+            self._states.clear()
+        else:
+            self._states.pop(lot_id, None)
+
+    def stats(self):
+        latencies = np.asarray(self.latencies) * 1000.0
+        if not len(latencies):
+            return {"requests": 0}
+        return {
+            "requests": len(latencies),
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "max_ms": float(latencies.max()),
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+        }
+
+def load_registry(data_root):
+    registry = LotRegistry()
+    for path in find_snapshot_stores(data_root):
+        registry.register_store(open_store(path))
+    return registry
+
+def load_server(checkpoint_path, data_root=None, device="cpu", **kwargs):
+    model = model_from_state_dict(load_model_state(checkpoint_path))
+    registry = load_registry(data_root) if data_root else LotRegistry()
+    return ForecastServer(model, registry, device=device, **kwargs)
+
+# Minimal HTTP/1.1 front end (keep-alive, JSON bodies) on asyncio streams:
+#   POST /predict {"lot_id", "occupancy"?: [...by node_id], "timestamp"?}
+#                 occupancy is required by models that take it as a feature
+#                 and optional (ignored) otherwise; see occupancy_used.
+#   POST /lots    {"lot_id", "nodes": [{node_id, x_pixel, y_pixel, is_handicapped}], "store_center"}
+#   POST /reset   {"lot_id"?}
+#   GET  /lots, GET /stats
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+async def handle_request(server, method, path, body):
+    if method == "GET" and path == "/stats":
+        return 200, server.stats()
+    if method == "GET" and path == "/lots":
+        return 200, {"lots": [{"lot_id": lot.lot_id, "num_nodes": lot.num_nodes} for lot in server.registry]}
+    if method != "POST":
+        return 405, {"error": "method not allowed"}
+
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError as e:
+        return 400, {"error": f"invalid JSON body: {e}"}
+    if not isinstance(payload, dict):
+        return 400, {"error": "request body must be a JSON object"}
+    required = {"/predict": ("lot_id",), "/lots": ("lot_id", "nodes", "store_center")}.get(path, ())
+    missing = [key for key in required if key not in payload]
+    if missing:
+        return 400, {"error": f"missing field(s): {', '.join(missing)}"}
+    if not isinstance(payload.get("lot_id", ""), (str, int)):
+        return 400, {"error": "lot_id must be a string"}
+    if not isinstance(payload.get("timestamp", 0), (int, float)):
+        return 400, {"error": "timestamp must be a number of seconds"}
+
+    if path == "/predict":
+        if payload["lot_id"] not in server.registry:
+            return 404, {"error": f"unknown lot {payload.get('lot_id')!r}"}
+        start = time.perf_counter()
+        probs = await server.predict(payload["lot_id"], payload.get("occupancy"), payload.get("timestamp"))
+        return 200, {
+            "lot_id": payload["lot_id"],
+            "node_ids": server.registry[payload["lot_id"]].nodes["node_id"].tolist(),
+            "probabilities": np.round(probs, 4).tolist(),
+            "occupancy_used": server.include_occupancy,
+            "latency_ms": (time.perf_counter() - start) * 1000.0,
+        }
+    if path == "/lots":
+        nodes = payload["nodes"]
+        if not isinstance(nodes, list) or not all(isinstance(node, dict) for node in nodes) or not nodes:
+            return 400, {"error": "nodes must be a non-empty list of {node_id, x_pixel, y_pixel, is_handicapped}"}
+        missing = sorted({"node_id", "x_pixel", "y_pixel", "is_handicapped"} - set.intersection(*map(set, nodes)))
+        if missing:
+            return 400, {"error": f"nodes are missing column(s): {', '.join(missing)}"}
+        center = payload["store_center"]
+        if not isinstance(center, list) or len(center) != 2 or not all(isinstance(v, (int, float)) for v in center):
+            return 400, {"error": "store_center must be [x, y]"}
+        lot = server.registry.register(payload["lot_id"], pd.DataFrame(nodes), payload["store_center"])
+        return 200, {"lot_id": lot.lot_id, "num_nodes": lot.num_nodes}
+    if path == "/reset":
+        server.reset(payload.get("lot_id"))
+        return 200, {"reset": payload.get("lot_id", "all")}
+    return 404, {"error": "not found"}
+
+async def handle_connection(server, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            try:
+                status, response = await handle_request(server, method, path, body)
+            except (KeyError, ValueError) as e:
+                status, response = 400, {"error": str(e)}
+            except Exception as e:
+                status, response = 500, {"error": str(e)}
+
+            data = json.dumps(response, separators=(",", ":")).encode()
+            keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                .encode() + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(server, host="127.0.0.1", port=8080):
+    server.start()
+    http = await asyncio.start_server(lambda r, w: handle_connection(server, r, w), host, port)
+    print(f"Serving {len(server.registry)} lots on http://{host}:{port}")
+    try:
+        async with http:
+            await http.serve_forever()
+    finally:
+        await server.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve live occupancy forecasts from a trained checkpoint.")
+    parser.add_argument("checkpoint")
+    parser.add_argument("--data-root", default=None, help="Register every lot with a snapshot store under this root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--dist-threshold", type=float, default=75)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    server = load_server(args.checkpoint, args.data_root, device=args.device, dist_threshold=args.dist_threshold,
+                         max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
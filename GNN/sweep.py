@@ -0,0 +1,223 @@
+import os
+import csv
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from model.GNN import TemporalForecastingGNN
+from utils.checkpointing import atomic_save
+from utils.geometric_graphs import StoreSequence, build_sequences, num_node_features, split_frames
+from utils.train_utils import train_loop, val_loop
+
+RESULT_COLUMNS = ["trial", "dist_threshold", "hidden_features", "lr", "weight_decay", "batch_size", "status",
+                  "epochs_run", "best_epoch", "best_val_loss", "final_train_loss", "seconds"]
+
+class SharedSequence:
+    # One recording with every snapshot's features and targets materialised
+    # once into shared memory, so trial processes read them without copying
+    # or re-decoding anything. Topologies are kept per dist_threshold and a
+    # trial picks its own with with_threshold().
+
+    def __init__(self, x, y, topologies, lot, dist_threshold=None):
+        self.x = x
+        self.y = y
+        self.topologies = topologies
+        self.lot = lot
+        self.dist_threshold = dist_threshold
+        if dist_threshold is not None:
+            self.edge_index, self.edge_weight = topologies[dist_threshold]
+
+    def with_threshold(self, dist_threshold):
+        return SharedSequence(self.x, self.y, self.topologies, self.lot, dist_threshold)
+
+    def __len__(self):
+        return len(self.x)
+
+    def snapshot(self, t):
+        return self.x[t].numpy(), self.y[t].numpy(), self.edge_index, self.edge_weight
+
+def build_shared_sequences(root_dir, dist_thresholds, horizons=None):
+    # Features do not depend on the graph, so they are built once from the
+    # stores; each lot's topology is built (or read from the manifest's graph
+    # cache) once per threshold.
+    sequences = build_sequences(root_dir, dist_thresholds[0], horizons, registry=None)
+    if not all(isinstance(seq, StoreSequence) for seq in sequences):
+        raise ValueError("Sweeps need snapshot stores; run ingest or convert_all_partitions first")
+
+    shared = []
+    for seq in sequences:
+        snapshots = [seq.snapshot(t) for t in range(len(seq))]
+        if not snapshots:
+            continue
+        x = torch.from_numpy(np.stack([s[0] for s in snapshots])).share_memory_()
+        y = torch.from_numpy(np.stack([s[1] for s in snapshots])).share_memory_()
+        topologies = {threshold: seq.lot.topology(threshold) for threshold in dist_thresholds}
+        shared.append(SharedSequence(x, y, topologies, seq.lot))
+    return shared
+
+def trial_grid(dist_thresholds, hidden_features, lrs, weight_decays, batch_sizes, max_trials=None, seed=0):
+    grid = [
+        {"dist_threshold": d, "hidden_features": h, "lr": lr, "weight_decay": wd, "batch_size": b}
+        for d, h, lr, wd, b in itertools.product(dist_thresholds, hidden_features, lrs, weight_decays, batch_sizes)
+    ]
+    if max_trials is not None and max_trials < len(grid):
+        grid = random.Random(seed).sample(grid, max_trials)
+    return [dict(config, trial=i) for i, config in enumerate(grid)]
+
+_sequences = None
+
+def _init_worker(sequences, threads):
+    # Each trial process gets a fixed slice of the cores; with several trials
+    # running side by side more intra-op threads would only contend.
+    global _sequences
+    _sequences = sequences
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+def should_stop(trial, epoch, best_val_loss, history, grace_epochs, patience, best_epoch):
+    # Median stopping rule: after grace_epochs, stop a trial whose best val
+    # loss so far is worse than the median of what the other trials had
+    # reached by the same epoch. Trials also stop after patience epochs
+    # without improvement.
+    if epoch - best_epoch >= patience:
+        return "stopped_plateau"
+    if epoch + 1 < grace_epochs:
+        return None
+    others = [min(losses[:epoch + 1]) for key, losses in history.items() if key != trial and len(losses) > epoch]
+    if others and best_val_loss > np.median(others):
+        return "stopped_median"
+    return None
+
+def run_trial(config, settings, history):
+    start = time.perf_counter()
+    torch.manual_seed(settings["seed"] + config["trial"])
+    sequences = [seq.with_threshold(config["dist_threshold"]) for seq in _sequences]
+    layout = "lanes" if settings["stateful"] else "sequential"
+    train_dataset, val_dataset, _ = split_frames(sequences, batch_size=config["batch_size"], prefetch=0,
+                                                 layout=layout)
+
+    horizons = settings["horizons"]
+    model = TemporalForecastingGNN(num_node_features(horizons), config["hidden_features"],
+                                   horizons=None if horizons is None else len(horizons))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=config["lr"], weight_decay=config["weight_decay"],
+                                  amsgrad=True)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer=optimizer, T_max=settings["epochs"])
+    criterion = torch.nn.BCEWithLogitsLoss()
+    device = torch.device("cpu")
+
+    losses = []
+    best_val_loss, best_epoch, status, train_loss = float("inf"), -1, "completed", float("nan")
+    for epoch in range(settings["epochs"]):
+        train_loss = train_loop(train_dataset, model, criterion, optimizer, device, verbose=False,
+                                stateful=settings["stateful"], tbptt_steps=settings["tbptt_steps"])
+        val_loss = val_loop(val_dataset, model, criterion, device, stateful=settings["stateful"])
+        scheduler.step()
+
+        losses.append(val_loss)
+        history[config["trial"]] = list(losses)
+        if val_loss < best_val_loss:
+            best_val_loss, best_epoch = val_loss, epoch
+            if settings["output_dir"]:
+                atomic_save({"config": config, "epoch": epoch, "model_state_dict": model.state_dict()},
+                            os.path.join(settings["output_dir"], f"trial_{config['trial']:03d}.pt"))
+
+        stop = should_stop(config["trial"], epoch, best_val_loss, dict(history), settings["grace_epochs"],
+                           settings["patience"], best_epoch)
+        if stop:
+            status = stop
+            break
+
+    return dict(config, status=status, epochs_run=len(losses), best_epoch=best_epoch + 1,
+                best_val_loss=best_val_loss, final_train_loss=train_loss, seconds=time.perf_counter() - start)
+
+def write_results(results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+def print_results(results):
+    print(f"{'trial':>5} {'dist':>6} {'hidden':>6} {'lr':>8} {'wd':>8} {'batch':>5} {'epochs':>6} "
+          f"{'best val':>10} {'seconds':>8}  status")
+    for r in results:
+        print(f"{r['trial']:>5} {r['dist_threshold']:>6g} {r['hidden_features']:>6} {r['lr']:>8g} "
+              f"{r['weight_decay']:>8g} {r['batch_size']:>5} {r['epochs_run']:>6} {r['best_val_loss']:>10.4f} "
+              f"{r['seconds']:>8.1f}  {r['status']}")
+
+def sweep(root_dir, trials, epochs=30, workers=None, threads_per_trial=None, horizons=None, stateful=False,
+          tbptt_steps=8, grace_epochs=3, patience=5, output_dir="sweep", seed=0):
+    cpu_count = os.cpu_count() or 1
+    workers = workers or max(1, min(len(trials), cpu_count // (threads_per_trial or 2)))
+    threads_per_trial = threads_per_trial or max(1, cpu_count // workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    thresholds = sorted({trial["dist_threshold"] for trial in trials})
+    sequences = build_shared_sequences(root_dir, thresholds, horizons)
+    print(f"Built {sum(len(seq) for seq in sequences)} shared snapshots for {len(thresholds)} thresholds "
+          f"in {time.perf_counter() - start:.1f}s; {len(trials)} trials on {workers} workers x "
+          f"{threads_per_trial} threads")
+
+    settings = {"epochs": epochs, "horizons": horizons, "stateful": stateful, "tbptt_steps": tbptt_steps,
+                "grace_epochs": grace_epochs, "patience": patience, "output_dir": output_dir, "seed": seed}
+    # spawn so workers start clean (no inherited OpenMP pools); the shared
+    # tensors travel as shared-memory handles, not copies.
+    context = mp.get_context("spawn")
+    results = []
+    with context.Manager() as manager:
+        history = manager.dict()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(sequences, threads_per_trial)) as executor:
+            futures = {executor.submit(run_trial, trial, settings, history): trial for trial in trials}
+            for future in as_completed(futures):
+                trial = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Trial {trial['trial']} failed: {e}")
+                    result = dict(trial, status="failed", epochs_run=0, best_epoch=0, best_val_loss=float("nan"),
+                                  final_train_loss=float("nan"), seconds=0.0)
+                results.append(result)
+                print(f"Trial {result['trial']} {result['status']} after {result['epochs_run']} epochs: "
+                      f"best val loss {result['best_val_loss']:.4f}")
+                write_results(sorted(results, key=lambda r: r["trial"]), os.path.join(output_dir, "results.csv"))
+
+    results.sort(key=lambda r: (np.isnan(r["best_val_loss"]), r["best_val_loss"]))
+    write_results(results, os.path.join(output_dir, "results.csv"))
+    print_results(results)
+    print(f"Sweep finished in {time.perf_counter() - start:.1f}s; results in {os.path.join(output_dir, 'results.csv')}")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parallel hyperparameter sweep over one shared dataset.")
+    parser.add_argument("data_root", nargs="?", default="Data")
+    parser.add_argument("--dist-threshold", type=float, nargs="+", default=[75])
+    parser.add_argument("--hidden", type=int, nargs="+", default=[256])
+    parser.add_argument("--lr", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--weight-decay", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[32])
+    parser.add_argument("--max-trials", type=int, default=None, help="Random subset of the grid")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-trial", type=int, default=None)
+    parser.add_argument("--horizons", type=float, nargs="+", default=None)
+    parser.add_argument("--stateful", action="store_true")
+    parser.add_argument("--tbptt-steps", type=int, default=8)
+    parser.add_argument("--grace-epochs", type=int, default=3)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--output-dir", default="sweep")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    trials = trial_grid(args.dist_threshold, args.hidden, args.lr, args.weight_decay, args.batch_size,
+                        args.max_trials, args.seed)
+    sweep(args.data_root, trials, epochs=args.epochs, workers=args.workers, threads_per_trial=args.threads_per_trial,
+          horizons=args.horizons, stateful=args.stateful, tbptt_steps=args.tbptt_steps,
+          grace_epochs=args.grace_epochs, patience=args.patience, output_dir=args.output_dir, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The pipeline imports its modules from GNN/ (from utils.x import ...), as
+# when running `python GNN <command>`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+import numpy as np
+import torch
+from torch_geometric_temporal.nn.recurrent import GConvGRU
+from model.chebyshev import CachedGConvGRU, graph_operator
+from utils.topology import compute_topology
+
+def lot_graph(num_nodes=60, seed=0):
+    rng = np.random.RandomState(seed)
+    edge_index, edge_weight = compute_topology(rng.randint(0, 300, size=(num_nodes, 2)), 75)
+    # A self-loop and an isolated spot, which the operator has to handle like ChebConv.
+    edge_index = np.hstack([edge_index, [[0], [0]]])
+    edge_weight = np.append(edge_weight, 1.0).astype(np.float32)
+    keep = (edge_index != num_nodes - 1).all(axis=0)
+    return torch.from_numpy(edge_index[:, keep]), torch.from_numpy(edge_weight[keep])
+
+def paired_layers(in_channels=5, out_channels=16, K=5):
+    torch.manual_seed(0)
+    reference = GConvGRU(in_channels, out_channels, K)
+    cached = CachedGConvGRU(in_channels, out_channels, K)
+    cached.load_state_dict(reference.state_dict())
+    return reference, cached
+
+def test_cached_gconvgru_matches_gconvgru():
+    edge_index, edge_weight = lot_graph()
+    reference, cached = paired_layers()
+    x = torch.rand(60, 5)
+    h = torch.rand(60, 16)
+    for H in (None, h):
+        expected = reference(x, edge_index, edge_weight, H=H)
+        torch.testing.assert_close(cached(x, edge_index, edge_weight, H=H), expected, rtol=1e-5, atol=1e-6)
+        operator = graph_operator(edge_index, edge_weight, 60)
+        torch.testing.assert_close(cached(x, edge_index, edge_weight, H=H, operator=operator), expected,
+                                   rtol=1e-5, atol=1e-6)
+
+def test_cached_gconvgru_gradients_match():
+    edge_index, edge_weight = lot_graph(seed=1)
+    reference, cached = paired_layers()
+    x = torch.rand(60, 5)
+    reference(x, edge_index, edge_weight).sum().backward()
+    cached(x, edge_index, edge_weight).sum().backward()
+    cached_grads = dict(cached.named_parameters())
+    for name, param in reference.named_parameters():
+        torch.testing.assert_close(cached_grads[name].grad, param.grad, rtol=1e-4, atol=1e-5)
+
+def test_graph_operator_is_reused_for_the_same_tensors():
+    edge_index, edge_weight = lot_graph()
+    operator = graph_operator(edge_index, edge_weight, 60)
+    assert graph_operator(edge_index, edge_weight, 60, operator) is operator
+    assert graph_operator(edge_index.clone(), edge_weight, 60, operator) is not operator
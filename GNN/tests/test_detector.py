@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+from utils.create_graphs import OccupancyDetector
+
+WINDOW = 8
+THRESHOLD = 25
+
+def patch_loop_labels(frames, positions, occupancy):
+    # The original per-spot loop from create_graphs.py: blur each patch of
+    # both frames and flip a spot when its mean abs-diff exceeds the threshold.
+    labels = []
+    prev_frame, prev_occupancy = frames[0], list(occupancy)
+    for frame in frames[1:]:
+        current = []
+        for i, (x, y) in enumerate(positions):
+            x1, x2 = max(0, x - WINDOW), min(frame.shape[1], x + WINDOW)
+            y1, y2 = max(0, y - WINDOW), min(frame.shape[0], y + WINDOW)
+            current_patch = cv2.GaussianBlur(frame[y1:y2, x1:x2], (3, 3), 0)
+            prev_patch = cv2.GaussianBlur(prev_frame[y1:y2, x1:x2], (3, 3), 0)
+            diff = np.mean(np.abs(current_patch.astype(np.int16) - prev_patch.astype(np.int16)))
+            current.append(1 - prev_occupancy[i] if diff > THRESHOLD else prev_occupancy[i])
+        labels.append(current)
+        prev_frame, prev_occupancy = frame, current
+    return np.array(labels, dtype=np.uint8)
+
+def synthetic_flight(num_frames=20, seed=0):
+    # Noisy gray lot with spots (some on the frame edge) that park and leave.
+    rng = np.random.RandomState(seed)
+    positions = np.array([[x, y] for y in range(4, 200, 30) for x in range(4, 300, 30)])
+    occupied = rng.rand(len(positions)) < 0.5
+    frames = []
+    for _ in range(num_frames):
+        frame = rng.randint(95, 105, size=(200, 300)).astype(np.uint8)
+        for (x, y) in positions[occupied]:
+            frame[max(0, y - WINDOW):y + WINDOW, max(0, x - WINDOW):x + WINDOW] = 200
+        frames.append(frame)
+        occupied ^= rng.rand(len(positions)) < 0.1
+    return frames, positions, np.zeros(len(positions), dtype=np.uint8)
+
+def test_patch_differences_match_per_patch_means_of_blurred_frames():
+    frames, positions, occupancy = synthetic_flight(2)
+    detector = OccupancyDetector(positions, occupancy, WINDOW, THRESHOLD)
+    detector.update(frames[0])
+    blurred = [cv2.GaussianBlur(frame, (3, 3), 0) for frame in frames]
+    expected = []
+    for x, y in positions:
+        x1, x2 = max(0, x - WINDOW), min(300, x + WINDOW)
+        y1, y2 = max(0, y - WINDOW), min(200, y + WINDOW)
+        expected.append(np.mean(np.abs(blurred[1][y1:y2, x1:x2].astype(np.int16)
+                                       - blurred[0][y1:y2, x1:x2].astype(np.int16))))
+    np.testing.assert_allclose(detector.patch_differences(blurred[1]), expected)
+
+def test_vectorized_detector_matches_patch_loop_labels():
+    frames, positions, occupancy = synthetic_flight()
+    detector = OccupancyDetector(positions, occupancy, WINDOW, THRESHOLD)
+    detector.update(frames[0])
+    labels = np.array([detector.update(frame)[0] for frame in frames[1:]])
+    np.testing.assert_array_equal(labels, patch_loop_labels(frames, positions, occupancy))
@@ -0,0 +1,38 @@
+import numpy as np
+from utils.event_store import EventStore
+from utils.snapshot_store import SnapshotStore, open_store
+from test_snapshot_store import assert_store_equal, make_flight
+
+def sticky_flight(num_frames=300, num_nodes=40, seed=1):
+    # Spots flip rarely, as in real flights, so events are sparse.
+    nodes, _, timestamps, names = make_flight(num_frames, num_nodes, seed)
+    rng = np.random.RandomState(seed)
+    flips = rng.rand(num_frames, num_nodes) < 0.05
+    occupancy = (np.cumsum(flips, axis=0) % 2 ^ (rng.rand(num_nodes) < 0.5)).astype(np.uint8)
+    return nodes, occupancy, timestamps, names
+
+def test_event_store_round_trip(tmp_path):
+    nodes, occupancy, timestamps, names = sticky_flight()
+    store = EventStore.create(str(tmp_path / "flight"), nodes, store_center=(3, 4), lot_id="lot")
+    with store.writer(chunk_size=64) as writer:
+        for t in range(200):
+            writer.write(occupancy[t], timestamps[t], names[t])
+    changed = np.diff(occupancy[199:], axis=0) != 0
+    store.append(occupancy[200:], timestamps[200:], names[200:], changed=changed)
+
+    reopened = EventStore.open(str(tmp_path / "flight"), checkpoint_interval=32)
+    assert isinstance(open_store(str(tmp_path / "flight")), EventStore)
+    assert reopened.num_events == int((np.diff(occupancy, axis=0) != 0).sum())
+    for candidate in (store, reopened):
+        assert_store_equal(candidate, nodes, occupancy, timestamps, names)
+
+    # Random access in any order, not only the sequential cursor path.
+    for t in np.random.RandomState(0).permutation(len(occupancy)):
+        np.testing.assert_array_equal(reopened.occupancy(t), occupancy[t])
+
+def test_event_store_from_snapshot_store(tmp_path):
+    nodes, occupancy, timestamps, names = sticky_flight(seed=2)
+    dense = SnapshotStore.from_arrays(nodes, occupancy, timestamps, names, lot_id="lot")
+    events = EventStore.from_store(dense, str(tmp_path / "events"), chunk_size=100)
+    assert_store_equal(open_store(str(tmp_path / "events")), nodes, occupancy, timestamps, names)
+    assert events.lot_id == "lot"
@@ -0,0 +1,83 @@
+import asyncio
+import numpy as np
+import pandas as pd
+import torch
+from model.GNN import TemporalForecastingGNN
+from utils.lots import LotRegistry
+from serve import ForecastServer
+
+def make_registry(sizes, seed=0):
+    rng = np.random.RandomState(seed)
+    registry = LotRegistry()
+    for lot_id, n in sizes.items():
+        nodes = pd.DataFrame({"node_id": range(n), "x_pixel": rng.randint(0, 300, n),
+                              "y_pixel": rng.randint(0, 300, n), "is_handicapped": rng.randint(0, 2, n)})
+        registry.register(lot_id, nodes, (150, 150))
+    return registry
+
+def make_server(registry, **kwargs):
+    torch.manual_seed(0)
+    return ForecastServer(TemporalForecastingGNN(5, 16), registry, **kwargs)
+
+def test_repeated_lot_reuses_graph_operator():
+    registry = make_registry({"A": 30})
+    server = make_server(registry)
+
+    async def run():
+        server.start()
+        try:
+            await server.predict("A", np.zeros(30), 1e9)
+            operator = server.model._operator
+            await server.predict("A", np.ones(30), 1e9 + 1)
+            return operator, server.model._operator
+        finally:
+            await server.stop()
+
+    first, second = asyncio.run(run())
+    assert first is not None and second is first
+
+def test_malformed_requests_are_bad_requests():
+    from serve import handle_request
+    server = make_server(make_registry({"A": 5}))
+
+    async def post(path, body):
+        return (await handle_request(server, "POST", path, body))[0]
+
+    async def run():
+        return [
+            await post("/predict", b"{not json"),
+            await post("/predict", b"[]"),
+            await post("/predict", b"{}"),
+            await post("/predict", b'{"lot_id": ["A"]}'),
+            await post("/predict", b'{"lot_id": "Z"}'),
+            await post("/lots", b'{"lot_id": "B"}'),
+            await post("/lots", b'{"lot_id": "B", "nodes": [{"node_id": 0}], "store_center": [0, 0]}'),
+        ]
+
+    assert asyncio.run(run()) == [400, 400, 400, 400, 404, 400, 400]
+
+def test_batched_responses_match_sequential():
+    sizes = {"A": 30, "B": 12, "C": 45}
+    rng = np.random.RandomState(0)
+    # Lot A repeats within a batch window, so its later frames have to wait
+    # for the next batch without overtaking each other.
+    order = ["A", "A", "B", "A", "C", "B", "A", "C", "C", "A"] * 3
+    requests = [(lot_id, rng.randint(0, 2, sizes[lot_id]), 1.7e9 + 60 * i) for i, lot_id in enumerate(order)]
+
+    async def run(server, concurrent):
+        server.start()
+        try:
+            if concurrent:
+                return await asyncio.gather(*[server.predict(*request) for request in requests])
+            return [await server.predict(*request) for request in requests]
+        finally:
+            await server.stop()
+
+    batched = make_server(make_registry(sizes), max_batch_size=8, max_wait_ms=50)
+    sequential = make_server(make_registry(sizes), max_batch_size=1)
+    batched_probs = asyncio.run(run(batched, True))
+    sequential_probs = asyncio.run(run(sequential, False))
+
+    assert max(batched.batch_sizes) > 1
+    for got, expected in zip(batched_probs, sequential_probs):
+        np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from utils.snapshot_store import SnapshotStore, open_store
+
+def make_flight(num_frames=300, num_nodes=40, seed=0):
+    rng = np.random.RandomState(seed)
+    nodes = pd.DataFrame({"node_id": rng.permutation(num_nodes), "x_pixel": rng.randint(0, 500, num_nodes),
+                          "y_pixel": rng.randint(0, 500, num_nodes), "is_handicapped": rng.randint(0, 2, num_nodes)})
+    occupancy = (rng.rand(num_frames, num_nodes) < 0.4).astype(np.uint8)
+    timestamps = 1.7e9 + np.arange(num_frames, dtype=np.float64)
+    timestamps[5] = np.nan
+    names = [f"DJI_20250101120000_{t:04d}_V" for t in range(num_frames)]
+    return nodes, occupancy, timestamps, names
+
+def assert_store_equal(store, nodes, occupancy, timestamps, names):
+    expected_nodes = nodes.sort_values(by="node_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(store.nodes, expected_nodes, check_dtype=False)
+    assert len(store) == len(occupancy)
+    np.testing.assert_array_equal([store.occupancy(t) for t in range(len(store))], occupancy)
+    np.testing.assert_array_equal(store.occupancy_window(17, 250), occupancy[17:250])
+    np.testing.assert_array_equal(store.timestamps, timestamps)
+    assert [store.frame_name(t) for t in range(len(store))] == names
+
+def test_snapshot_store_round_trip(tmp_path):
+    nodes, occupancy, timestamps, names = make_flight()
+    store = SnapshotStore.create(str(tmp_path / "flight"), nodes, store_center=(12.5, 40), lot_id="lot")
+    with store.writer(chunk_size=64) as writer:
+        for t in range(200):
+            writer.write(occupancy[t], timestamps[t], names[t])
+    store.append(occupancy[200:], timestamps[200:], names[200:])
+
+    reopened = open_store(str(tmp_path / "flight"))
+    assert isinstance(reopened, SnapshotStore)
+    assert reopened.lot_id == "lot" and tuple(reopened.store_center) == (12.5, 40.0)
+    for candidate in (store, reopened):
+        assert_store_equal(candidate, nodes, occupancy, timestamps, names)
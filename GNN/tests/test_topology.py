@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from scipy.spatial import distance_matrix
+from utils.topology import compute_topology
+
+def dense_topology(coords, dist_threshold):
+    # The original O(N^2) scan from build_dynamic_dataset.
+    dist_mat = distance_matrix(coords, coords)
+    sigma = dist_threshold / 2
+    edge_list, edge_weights = [], []
+    for i in range(len(coords)):
+        for j in range(len(coords)):
+            if i != j and dist_mat[i, j] <= dist_threshold:
+                edge_list.append([i, j])
+                edge_weights.append(np.exp(-(dist_mat[i, j] ** 2) / (2 * sigma ** 2)))
+    return np.array(edge_list).T.astype(np.int64), np.array(edge_weights, dtype=np.float32)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_kdtree_topology_matches_dense_scan(seed):
+    rng = np.random.RandomState(seed)
+    coords = rng.randint(0, 400, size=(150, 2))
+    edge_index, edge_weight = compute_topology(coords, 75)
+    expected_index, expected_weight = dense_topology(coords, 75)
+    np.testing.assert_array_equal(edge_index, expected_index)
+    np.testing.assert_allclose(edge_weight, expected_weight, rtol=1e-6)
+
+def test_kdtree_topology_keeps_edges_at_the_threshold():
+    # Grid spots exactly dist_threshold apart stay connected, as with <=.
+    coords = np.stack(np.meshgrid(np.arange(0, 300, 25), np.arange(0, 100, 25)), axis=-1).reshape(-1, 2)
+    edge_index, edge_weight = compute_topology(coords, 75)
+    expected_index, expected_weight = dense_topology(coords, 75)
+    np.testing.assert_array_equal(edge_index, expected_index)
+    np.testing.assert_allclose(edge_weight, expected_weight, rtol=1e-6)
@@ -1,40 +1,152 @@
+import os
+import argparse
 import torch
-from model.GNN import TemporalGNN
-from utils.train_utils import train_loop, val_loop, save_checkpoint
-from utils.geometric_graphs import build_dynamic_dataset
+from torch.nn.parallel import DistributedDataParallel
+from model.GNN import TemporalForecastingGNN, compile_recurrent_layers
+from utils.train_utils import train_loop, val_loop
+from utils.checkpointing import CheckpointManager
+from utils import profiling
+from utils.distributed import init_distributed, is_main_process, shard_dataset, all_reduce_mean, barrier, cleanup
+from utils.geometric_graphs import build_dynamic_dataset, num_node_features
+from utils.lots import LotRegistry
+from utils.manifest import update_manifest
+from utils.partition import ClusterPredictor
 from evaluate import evaluate_and_save_predictions
 
-batch_size = 32
-epochs = 30
-device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+# Launched with torchrun (e.g. torchrun --nproc_per_node=4 train.py) this
+# trains with DistributedDataParallel over gloo: each rank takes a contiguous,
+# time-ordered shard of the batches, and rank 0 writes checkpoints and runs
+# the final evaluation. A plain `python train.py` stays single-process.
+#
+# Settings:
+# - stateful carries GConvGRU hidden states across snapshots, truncating BPTT
+#   every tbptt_steps batches. Needs the "lanes" batch layout so consecutive
+#   batches continue the same per-lane frame sequences.
+# - horizons forecasts occupancy this many minutes ahead in one pass, e.g.
+#   (5, 15, 30, 60); None keeps the single current-frame head.
+# - amp_dtype (torch.bfloat16 on CPU), compile_recurrent (in-place
+#   torch.compile of the GConvGRU stack) and accumulate_steps (gradient
+#   accumulation) make up the opt-in fast path. Loss is only synced every
+#   log_interval batches.
+# - Checkpoints are written in the background to checkpoint_dir, keeping the
+#   last keep_checkpoints epochs plus best.pt; training resumes at the start
+#   of the epoch after the newest one.
+# - profile records spans/counters for the whole run and writes a Chrome
+#   trace plus a summary table at the end (also enabled by BRAINWAVE_PROFILE=1).
+# - For lots too large to train whole, cluster_size trains on spatial
+#   clusters of at most that many spots (plus halo_hops of neighbours) and
+#   evaluates by stitching per-cluster predictions (with the same halo) back
+#   into full-lot graphs.
 
-distance_threshold = 75
+def train(data_root="Data", batch_size=32, epochs=30, distance_threshold=75, learning_rate=0.01, weight_decay=0.01,
+          stateful=False, tbptt_steps=8, horizons=None, amp_dtype=None, compile_recurrent=False, accumulate_steps=1,
+          log_interval=100, checkpoint_dir="checkpoints", keep_checkpoints=3, profile=False, cluster_size=None,
+          halo_hops=2, predictions_path="val_predictions.npys"):
+    rank, world_size = init_distributed(backend="gloo")
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+    device = torch.device(f'cuda:{local_rank}' if torch.cuda.is_available() else 'cpu')
+    if profile:
+        profiling.enable()
 
-train_dataset, val_dataset, test_dataset = build_dynamic_dataset("Data", dist_threshold=distance_threshold)
+    # Only rank 0 refreshes the dataset manifest; the others read it once it
+    # is written.
+    if is_main_process():
+        update_manifest(data_root)
+    barrier()
 
-model = TemporalGNN(node_features=4).to(device)
-for param in model.parameters():
-    param.retain_grad()
-learning_rate = 0.01
-optimizer = torch.optim.AdamW(model.parameters(), lr=0.01, weight_decay=0.01, amsgrad=True)
-criterion = torch.nn.BCEWithLogitsLoss()
-scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer=optimizer, T_max=epochs)
+    registry = LotRegistry()
+    train_dataset, val_dataset, test_dataset = build_dynamic_dataset(
+        data_root, batch_size=batch_size, dist_threshold=distance_threshold, lazy=True,
+        layout="lanes" if stateful else "sequential", horizons=horizons, registry=registry,
+        cluster_size=cluster_size, halo_hops=halo_hops, refresh_manifest=False,
+    )
 
-train_losses = []
-val_losses = []
+    model = TemporalForecastingGNN(
+        node_features=num_node_features(horizons), horizons=None if horizons is None else len(horizons),
+    ).to(device)
+    if compile_recurrent:
+        compile_recurrent_layers(model)
+    train_model = DistributedDataParallel(model) if world_size > 1 else model
+    train_shard = shard_dataset(train_dataset)
+    val_shard = shard_dataset(val_dataset)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=weight_decay, amsgrad=True)
+    criterion = torch.nn.BCEWithLogitsLoss()
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer=optimizer, T_max=epochs)
 
-model.train()
+    train_losses = []
+    val_losses = []
+    start_epoch = 0
 
-for epoch in range(epochs):
-    print(f"Epoch {epoch+1}")
-    train_loss = train_loop(train_dataset, model, criterion, optimizer, device)
-    val_loss = val_loop(val_dataset, model, criterion, device)
+    checkpoints = CheckpointManager(checkpoint_dir, keep_last=keep_checkpoints)
+    resumed = checkpoints.resume(model, optimizer, scheduler)
+    if resumed is not None:
+        position, train_losses, val_losses = resumed
+        start_epoch = position['epoch']
+        if is_main_process():
+            print(f"Resuming from {checkpoints.latest()} at epoch {start_epoch+1}")
 
-    scheduler.step()
-    train_losses.append(train_loss)
-    val_losses.append(val_loss)
+    model.train()
 
-    print(f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f}")
-    save_checkpoint(model, optimizer, scheduler, epoch, train_losses, val_losses)
+    for epoch in range(start_epoch, epochs):
+        if is_main_process():
+            print(f"Epoch {epoch+1}")
+        train_loss = train_loop(train_shard, train_model, criterion, optimizer, device, verbose=is_main_process(),
+                                stateful=stateful, tbptt_steps=tbptt_steps, amp_dtype=amp_dtype,
+                                accumulate_steps=accumulate_steps, log_interval=log_interval)
+        val_loss = val_loop(val_shard, model, criterion, device, stateful=stateful, amp_dtype=amp_dtype)
+        train_loss = all_reduce_mean(train_loss)
+        val_loss = all_reduce_mean(val_loss)
 
-evaluate_and_save_predictions(test_dataset, model, device, output_path="val_predictions.json")
\ No newline at end of file
+        scheduler.step()
+        train_losses.append(train_loss)
+        val_losses.append(val_loss)
+
+        if is_main_process():
+            print(f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f}")
+            checkpoints.save(epoch, model, optimizer, scheduler, train_losses, val_losses)
+
+    checkpoints.close()
+
+    if is_main_process():
+        eval_model = model if cluster_size is None else ClusterPredictor(model, registry, distance_threshold,
+                                                                         cluster_size, halo_hops)
+        evaluate_and_save_predictions(test_dataset, eval_model, device, output_path=predictions_path,
+                                      stateful=stateful, horizons=horizons)
+        profiling.finish(trace_path="profile_trace.json", summary_path="profile_summary.json")
+
+    barrier()
+    cleanup()
+    return model, train_losses, val_losses
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the occupancy forecaster (run under torchrun for DDP).")
+    parser.add_argument("data_root", nargs="?", default="Data")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--dist-threshold", type=float, default=75)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--weight-decay", type=float, default=0.01)
+    parser.add_argument("--stateful", action="store_true")
+    parser.add_argument("--tbptt-steps", type=int, default=8)
+    parser.add_argument("--horizons", type=float, nargs="+", default=None, help="Minutes ahead, e.g. 5 15 30 60")
+    parser.add_argument("--amp-dtype", choices=("bfloat16", "float16"), default=None)
+    parser.add_argument("--compile", action="store_true", help="torch.compile the GConvGRU stack")
+    parser.add_argument("--accumulate-steps", type=int, default=1)
+    parser.add_argument("--log-interval", type=int, default=100)
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--keep-checkpoints", type=int, default=3)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--cluster-size", type=int, default=None)
+    parser.add_argument("--halo-hops", type=int, default=2)
+    parser.add_argument("--predictions", default="val_predictions.npys", help=".npys, .jsonl or .json")
+    args = parser.parse_args(argv)
+
+    train(args.data_root, batch_size=args.batch_size, epochs=args.epochs, distance_threshold=args.dist_threshold,
+          learning_rate=args.lr, weight_decay=args.weight_decay, stateful=args.stateful, tbptt_steps=args.tbptt_steps,
+          horizons=args.horizons, amp_dtype=getattr(torch, args.amp_dtype) if args.amp_dtype else None,
+          compile_recurrent=args.compile, accumulate_steps=args.accumulate_steps, log_interval=args.log_interval,
+          checkpoint_dir=args.checkpoint_dir, keep_checkpoints=args.keep_checkpoints, profile=args.profile,
+          cluster_size=args.cluster_size, halo_hops=args.halo_hops, predictions_path=args.predictions)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import re
+import queue
+import random
+import threading
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"^tfpp_checkpoint_(\d+)\.pt$")
+
+def _to_cpu(obj):
+    # Snapshot tensors so training can keep mutating parameters and optimizer
+    # state while the copy is serialised on the writer thread.
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return obj
+
+def rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+def atomic_save(payload, path):
+    tmp_path = path + ".tmp"
+    torch.save(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+class CheckpointManager:
+    # Writes checkpoints on a background thread (atomically, via a temp file
+    # and rename), keeps the newest keep_last epochs plus best.pt for the
+    # lowest validation loss, and restores everything train.py needs to pick
+    # up after a preemption. Checkpoints are written at the end of an epoch,
+    # so training resumes at the start of the next one: the lazy datasets are
+    # deterministic, and data_position only records that epoch. Work done in
+    # a partial epoch is redone.
+
+    def __init__(self, directory="checkpoints", keep_last=3):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.best_val_loss = float("inf")
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                payload, paths = item
+                for path in paths:
+                    atomic_save(payload, path)
+                self._rotate()
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def checkpoints(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = CHECKPOINT_PATTERN.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(found)]
+
+    def _rotate(self):
+        for path in self.checkpoints()[:-self.keep_last]:
+            os.remove(path)
+
+    def save(self, epoch, model, optimizer, scheduler, train_losses, val_losses):
+        self._raise_pending_error()
+
+        val_loss = val_losses[-1] if val_losses else float("inf")
+        is_best = val_loss < self.best_val_loss
+        if is_best:
+            self.best_val_loss = val_loss
+
+        payload = _to_cpu({
+            'epoch': epoch,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'scheduler_state_dict': scheduler.state_dict(),
+            'train_losses': list(train_losses),
+            'val_losses': list(val_losses),
+            'best_val_loss': self.best_val_loss,
+            'rng_state': rng_state(),
+            'data_position': {'epoch': epoch + 1},
+        })
+
+        paths = [os.path.join(self.directory, f"tfpp_checkpoint_{epoch}.pt")]
+        if is_best:
+            paths.append(os.path.join(self.directory, "best.pt"))
+        self._queue.put((payload, paths))
+
+    def latest(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def resume(self, model, optimizer, scheduler, path=None, map_location="cpu"):
+        path = path or self.latest()
+        if path is None:
+            return None
+
+        checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+        model.load_state_dict(checkpoint['model_state_dict'])
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        set_rng_state(checkpoint['rng_state'])
+        self.best_val_loss = checkpoint.get('best_val_loss', float("inf"))
+        return checkpoint['data_position'], checkpoint['train_losses'], checkpoint['val_losses']
+
+    def wait(self):
+        self._queue.join()
+        self._raise_pending_error()
+
+    def close(self):
+        self.wait()
+        self._queue.put(None)
+        self._writer.join()
+
+def load_model_state(path, map_location="cpu"):
+    # Accepts a full training checkpoint or a bare model state dict.
+    checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+    return checkpoint.get('model_state_dict', checkpoint)
@@ -1,66 +1,137 @@
 import cv2
 import pandas as pd
 import os
+import argparse
 import numpy as np
+from utils.frame_source import FrameSource
+from utils.snapshot_store import SnapshotStore, is_snapshot_store, open_store
+from utils.event_store import EventStore
+from utils import profiling
 
-image_folder = ""
-output_folder = ""
-nodes_csv = ""
-window_size = 8
-diff_threshold = 25
-os.makedirs(output_folder, exist_ok=True)
+class OccupancyDetector:
+    # Frame-differencing occupancy labeller. Each frame is blurred once and the
+    # blurred frame is kept for the next comparison; per-spot mean absolute
+    # differences come from one integral image over the whole-frame abs-diff.
 
-nodes = pd.read_csv(nodes_csv)
-positions = nodes[['x_pixel', 'y_pixel']].values.astype(int)
-node_ids = nodes['node_id'].values
-is_handicapped = nodes['is_handicapped'].values
-prev_occupancy = nodes['is_occupied'].tolist()
+    def __init__(self, positions, initial_occupancy, window_size=8, diff_threshold=25):
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.occupancy = np.asarray(initial_occupancy, dtype=np.uint8).copy()
+        self.window_size = window_size
+        self.diff_threshold = diff_threshold
+        self._prev_blurred = None
+        self._frame_shape = None
 
-image_files = sorted(f for f in os.listdir(image_folder) if f.lower().endswith(('.jpg', '.png')))
+    def _build_windows(self, frame_shape):
+        height, width = frame_shape[:2]
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        self._x1 = np.clip(x - self.window_size, 0, width)
+        self._x2 = np.clip(x + self.window_size, 0, width)
+        self._y1 = np.clip(y - self.window_size, 0, height)
+        self._y2 = np.clip(y + self.window_size, 0, height)
+        area = (self._x2 - self._x1) * (self._y2 - self._y1)
+        self._area = np.where(area > 0, area, 1).astype(np.float64)
+        self._empty = area <= 0
+        self._frame_shape = frame_shape[:2]
 
-first_img_path = os.path.join(image_folder, image_files[0])
-first_frame = cv2.imread(first_img_path)
-prev_frame = cv2.cvtColor(first_frame, cv2.COLOR_BGR2GRAY)
+    def patch_differences(self, blurred):
+        diff = cv2.absdiff(blurred, self._prev_blurred)
+        integral = cv2.integral(diff, sdepth=cv2.CV_64F)
+        sums = (integral[self._y2, self._x2] - integral[self._y1, self._x2]
+                - integral[self._y2, self._x1] + integral[self._y1, self._x1])
+        means = sums / self._area
+        means[self._empty] = 0.0
+        return means
 
-for idx in range(1, len(image_files)):
-    img_file = image_files[idx]
-    img_path = os.path.join(image_folder, img_file)
-    name = os.path.splitext(img_file)[0]
-    output_path = os.path.join(output_folder, f"{name}_labels.csv")
+    def update(self, frame_gray):
+        if frame_gray.shape[:2] != self._frame_shape:
+            self._build_windows(frame_gray.shape)
+            self._prev_blurred = None
 
-    frame = cv2.imread(img_path)
-    frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    occupancy = []
+        blurred = cv2.GaussianBlur(frame_gray, (3, 3), 0)
+        if self._prev_blurred is None:
+            self._prev_blurred = blurred
+            return self.occupancy.copy(), np.zeros(len(self.occupancy), dtype=bool)
 
-    for i, (x, y) in enumerate(positions):
-        x1, x2 = max(0, x - window_size), min(frame.shape[1], x + window_size)
-        y1, y2 = max(0, y - window_size), min(frame.shape[0], y + window_size)
+        changed = self.patch_differences(blurred) > self.diff_threshold
+        self.occupancy = np.where(changed, 1 - self.occupancy, self.occupancy).astype(np.uint8)
+        self._prev_blurred = blurred
+        return self.occupancy.copy(), changed
 
-        current_patch = frame_gray[y1:y2, x1:x2]
-        prev_patch = prev_frame[y1:y2, x1:x2]
+def label_frames(source_path, nodes_csv, output_store, window_size=8, diff_threshold=25, flight_name=None,
+                 store_center=(967, 936), scale=1.0, crop=True, decode_threads=2, frame_step=1, verbose=True,
+                 lot_id=None, append=False, events=False):
+    # Stores live next to the flight's frames, e.g. Data/<DJI flight>/snapshots.
+    # With append, an existing store is extended with the frames after its
+    # last one instead of being relabelled from scratch. With events the store
+    # keeps only the detector's per-spot changes (see EventStore).
+    if flight_name is None:
+        flight_name = os.path.basename(os.path.dirname(os.path.normpath(output_store)))
 
-        current_patch = cv2.GaussianBlur(current_patch, (3, 3), 0)
-        prev_patch = cv2.GaussianBlur(prev_patch, (3, 3), 0)
+    nodes = pd.read_csv(nodes_csv).sort_values(by="node_id").reset_index(drop=True)
+    positions = nodes[['x_pixel', 'y_pixel']].values.astype(int)
 
-        diff = np.mean(np.abs(current_patch.astype(np.int16) - prev_patch.astype(np.int16)))
+    store = open_store(output_store) if append and is_snapshot_store(output_store) else None
+    if store is not None and len(store):
+        # Resume from the last stored frame: it is decoded again to seed the
+        # detector with that frame and its stored occupancy.
+        start_after, initial_occupancy = store.frame_name(len(store) - 1), store.occupancy(len(store) - 1)
+    else:
+        store_cls = EventStore if events else SnapshotStore
+        store = store_cls.create(output_store, nodes, store_center=store_center, lot_id=lot_id or flight_name,
+                                 overwrite=True)
+        start_after, initial_occupancy = None, nodes['is_occupied'].values
 
-        if diff > diff_threshold:
-            occ = 1 - prev_occupancy[i]
-        else:
-            occ = prev_occupancy[i]
+    source = FrameSource(source_path, flight_name=flight_name, crop_positions=positions if crop else None,
+                         margin=2 * window_size, scale=scale, num_threads=decode_threads, frame_step=frame_step,
+                         start_after=start_after)
+    detector = OccupancyDetector(source.transform_positions(positions), initial_occupancy,
+                                 max(1, int(round(window_size * scale))), diff_threshold)
 
-        occupancy.append(occ)
+    # The first frame only seeds the detector; labels start from the second.
+    with store.writer() as writer:
+        for idx, (name, timestamp, frame_gray) in enumerate(source):
+            profiling.count("frames_decoded")
+            with profiling.span("detect_occupancy"):
+                occupancy, changed = detector.update(frame_gray)
+            if idx == 0:
+                continue
 
-    print(f"Frame: {img_file} — Occupied spots: {sum(occupancy)}/{len(occupancy)}")
+            if verbose:
+                print(f"Frame: {name} — Occupied spots: {int(occupancy.sum())}/{len(occupancy)}")
 
-    df = pd.DataFrame({
-        "node_id": node_ids,
-        "x_pixel": positions[:, 0],
-        "y_pixel": positions[:, 1],
-        "is_handicapped": is_handicapped,
-        "is_occupied": occupancy
-    })
-    df.to_csv(output_path, index=False)
+            with profiling.span("store_write"):
+                if isinstance(store, EventStore):
+                    writer.write(occupancy, timestamp, name, changed=changed)
+                else:
+                    writer.write(occupancy, timestamp, name)
+            profiling.count("frames_labelled")
 
-    prev_frame = frame_gray
-    prev_occupancy = occupancy.copy()
\ No newline at end of file
+    return store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label parking-spot occupancy by frame differencing.")
+    parser.add_argument("source", nargs="+", help="Image folder or DJI video file(s)")
+    parser.add_argument("nodes_csv")
+    parser.add_argument("output_store")
+    parser.add_argument("--window-size", type=int, default=8)
+    parser.add_argument("--diff-threshold", type=float, default=25)
+    parser.add_argument("--flight-name", default=None)
+    parser.add_argument("--lot-id", default=None)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--no-crop", action="store_true")
+    parser.add_argument("--decode-threads", type=int, default=2)
+    parser.add_argument("--frame-step", type=int, default=1)
+    parser.add_argument("--events", action="store_true", help="Store per-spot change events instead of full frames")
+    parser.add_argument("--profile", action="store_true", help="Write profile_trace.json and profile_summary.json")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        profiling.enable()
+    label_frames(args.source, args.nodes_csv, args.output_store, window_size=args.window_size,
+                 diff_threshold=args.diff_threshold, flight_name=args.flight_name, scale=args.scale,
+                 crop=not args.no_crop, decode_threads=args.decode_threads, frame_step=args.frame_step,
+                 lot_id=args.lot_id, events=args.events)
+    profiling.finish(trace_path="profile_trace.json", summary_path="profile_summary.json")
+
+if __name__ == "__main__":
+    main()
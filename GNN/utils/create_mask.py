@@ -1,69 +1,84 @@
+import argparse
 import cv2
 import pandas as pd
 import numpy as np
 
-image_path = ""
-output_csv = ""
-output_mask = ""
+WINDOW_NAME = "Click Parking Spots"
 
-coords = []
-handicapped_flag = False
-occupied_flag = False
-node_id = 0
+def create_mask(image_path, output_csv, output_mask):
+    # Click every parking spot on a lot image to build its node table. Press
+    # h / o before a click to mark the spot handicapped / occupied, s to save
+    # and q to quit without saving. Returns the node table (None if quit).
+    img = cv2.imread(image_path)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image {image_path}")
+    mask = np.zeros_like(img)
+    coords = []
+    flags = {"handicapped": False, "occupied": False}
 
-img = cv2.imread(image_path)
-mask = np.zeros_like(img)
+    def click_event(event, x, y, _flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            node_id = len(coords)
+            handicapped_flag, occupied_flag = flags["handicapped"], flags["occupied"]
+            coords.append((node_id, x, y, int(handicapped_flag), int(occupied_flag)))
 
-def click_event(event, x, y, flags, param):
-    global node_id, handicapped_flag, occupied_flag
+            if handicapped_flag and occupied_flag:
+                color = (255, 255, 0)
+            elif handicapped_flag:
+                color = (255, 0, 0)
+            elif occupied_flag:
+                color = (0, 0, 255)
+            else:
+                color = (0, 255, 0)
 
-    if event == cv2.EVENT_LBUTTONDOWN:
-        coords.append((node_id, x, y, int(handicapped_flag), int(occupied_flag)))
+            cv2.circle(img, (x, y), 5, color, -1)
+            cv2.putText(img, str(node_id), (x + 5, y - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-        if handicapped_flag and occupied_flag:
-            color = (255, 255, 0)
-        elif handicapped_flag:
-            color = (255, 0, 0)
-        elif occupied_flag:
-            color = (0, 0, 255)
-        else:
-            color = (0, 255, 0)
+            mask_color = (255, 0, 0) if handicapped_flag else (0, 255, 0)
+            cv2.circle(mask, (x, y), 5, mask_color, -1)
+            cv2.putText(mask, str(node_id), (x + 5, y - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
-        cv2.circle(img, (x, y), 5, color, -1)
-        cv2.putText(img, str(node_id), (x + 5, y - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            flags["handicapped"] = False
+            flags["occupied"] = False
 
-        mask_color = (255, 0, 0) if handicapped_flag else (0, 255, 0)
-        cv2.circle(mask, (x, y), 5, mask_color, -1)
-        cv2.putText(mask, str(node_id), (x + 5, y - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            cv2.imshow(WINDOW_NAME, img)
 
-        node_id += 1
-        handicapped_flag = False
-        occupied_flag = False
+    cv2.namedWindow(WINDOW_NAME)
+    cv2.setMouseCallback(WINDOW_NAME, click_event)
+    cv2.imshow(WINDOW_NAME, img)
 
-        cv2.imshow("Click Parking Spots", img)
+    while True:
+        key = cv2.waitKey(0) & 0xFF
 
-cv2.namedWindow("Click Parking Spots")
-cv2.setMouseCallback("Click Parking Spots", click_event)
-cv2.imshow("Click Parking Spots", img)
+        if key == ord('h'):
+            flags["handicapped"] = True
+        elif key == ord('o'):
+            flags["occupied"] = True
+        elif key == ord('s'):
+            break
+        elif key == ord('q'):
+            coords = []
+            break
 
-while True:
-    key = cv2.waitKey(0) & 0xFF
+    cv2.destroyAllWindows()
 
-    if key == ord('h'):
-        handicapped_flag = True
-    elif key == ord('o'):
-        occupied_flag = True
-    elif key == ord('s'):
-        break
-    elif key == ord('q'):
-        coords = []
-        break
-
-cv2.destroyAllWindows()
-
-if coords:
+    if not coords:
+        return None
     df = pd.DataFrame(coords, columns=["node_id", "x_pixel", "y_pixel", "is_handicapped", "is_occupied"])
     df.to_csv(output_csv, index=False)
-    cv2.imwrite(output_mask, mask)
\ No newline at end of file
+    cv2.imwrite(output_mask, mask)
+    return df
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Click parking spots on a lot image to create its node table and mask.")
+    parser.add_argument("image_path")
+    parser.add_argument("output_csv")
+    parser.add_argument("output_mask")
+    args = parser.parse_args(argv)
+
+    create_mask(args.image_path, args.output_csv, args.output_mask)
+
+if __name__ == "__main__":
+    main()
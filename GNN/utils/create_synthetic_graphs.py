@@ -1,87 +1,157 @@
-import os
-import pandas as pd
+import argparse
 import numpy as np
-import shutil
-from datetime import datetime, timedelta
-import re
 from tqdm import tqdm
-import math
-
-data_root = ''
-output_dir = ''
-
-store_center = (967, 936)
-x_center, y_center = store_center
-
-def extract_timestamp_from_filename(filename):
-    match = re.match(r'DJI_(\d{14})_', filename)
-    if match:
-        return datetime.strptime(match.group(1), "%Y%m%d%H%M%S")
-    return None
-
-def get_all_graph_paths(data_root):
-    graph_paths = []
-    for root, dirs, files in os.walk(data_root):
-        for file in files:
-            if file.endswith('.csv') and file.startswith('DJI_'):
-                full_path = os.path.join(root, file)
-                timestamp = extract_timestamp_from_filename(file)
-                if timestamp:
-                    graph_paths.append((timestamp, full_path))
-    graph_paths.sort(key=lambda x: x[0])
-    return graph_paths
-
-def compute_time_features(dt):
-    time_of_day = dt.hour + dt.minute / 60 + dt.second / 3600
-    normalized_time = time_of_day / 24.0
-    sin_time = math.sin(2 * math.pi * normalized_time)
-    cos_time = math.cos(2 * math.pi * normalized_time)
-    return sin_time, cos_time
-
-def interpolate_graphs(g1_df, g2_df, alpha):
-    interp_df = g1_df.copy()
-    for col in g1_df.columns:
-        if col == 'is_occupied':
-            interp_df[col] = (1 - alpha) * g1_df[col] + alpha * g2_df[col]
-            interp_df[col] = interp_df[col].round().astype(int)
-        elif np.issubdtype(g1_df[col].dtype, np.number):
-            interp_df[col] = (1 - alpha) * g1_df[col] + alpha * g2_df[col]
-    return interp_df
-
-def generate_interpolated_graphs(graph_paths, output_dir):
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
-
-    for i in tqdm(range(len(graph_paths) - 1)):
-        t1, path1 = graph_paths[i]
-        t2, path2 = graph_paths[i + 1]
-        delta = int((t2 - t1).total_seconds())
-
-        g1 = pd.read_csv(path1)
-        g2 = pd.read_csv(path2)
-
-        sin_time, cos_time = compute_time_features(t1)
-        g1['time_sin'] = sin_time
-        g1['time_cos'] = cos_time
-        original_filename = os.path.basename(path1)
-        g1.to_csv(os.path.join(output_dir, original_filename), index=False)
-
-        for s in range(1, delta):
-            intermediate_time = t1 + timedelta(seconds=s)
-            alpha = s / delta
-            interp_df = interpolate_graphs(g1, g2, alpha)
-
-            sin_time, cos_time = compute_time_features(intermediate_time)
-            interp_df['time_sin'] = sin_time
-            interp_df['time_cos'] = cos_time
-
-            interp_filename = f"DJI_{intermediate_time.strftime('%Y%m%d%H%M%S')}_interp_{i}_{s}.csv"
-            interp_df.to_csv(os.path.join(output_dir, interp_filename), index=False)
-
-    t_last, path_last = graph_paths[-1]
-    g_last = pd.read_csv(path_last)
-    sin_time, cos_time = compute_time_features(t_last)
-    g_last['time_sin'] = sin_time
-    g_last['time_cos'] = cos_time
-    g_last.to_csv(os.path.join(output_dir, os.path.basename(path_last)), index=False)
\ No newline at end of file
+from utils.snapshot_store import SnapshotStore, is_snapshot_store, open_store
+from utils.event_store import EventStore
+
+def store_keyframes(store):
+    # (timestamp, frame) for every captured frame of one flight or lot store,
+    # in time order.
+    keyframes = [(timestamp, t) for t, timestamp in enumerate(store.timestamps) if not np.isnan(timestamp)]
+    keyframes.sort(key=lambda x: x[0])
+    return keyframes
+
+def interpolate_occupancy(occ1, occ2, alpha):
+    return np.rint((1 - alpha) * occ1 + alpha * occ2).astype(np.uint8)
+
+def interpolate_segment(occ1, occ2, steps):
+    # All S = steps - 1 intermediate seconds between two keyframes at once as
+    # an (S, N) array; row s - 1 matches interpolate_occupancy(occ1, occ2, s / steps).
+    alpha = (np.arange(1, steps, dtype=np.float32) / steps)[:, None]
+    occ1 = np.asarray(occ1, dtype=np.float32)[None, :]
+    occ2 = np.asarray(occ2, dtype=np.float32)[None, :]
+    return np.rint((1 - alpha) * occ1 + alpha * occ2).astype(np.uint8)
+
+def generate_interpolated_store(store, output_path, rebuild=False, chunk_size=4096, events=False):
+    # Appends the keyframes of one flight or lot store and their per-second
+    # interpolations to output_path. Keyframes at or before the output's last
+    # timestamp were already processed on an earlier run and are skipped; only
+    # new keyframe pairs are interpolated, so nothing is wiped and re-run.
+    # Interpolated seconds only differ where a spot flips, so events=True
+    # stores them as change events.
+    keyframes = store_keyframes(store)
+    if not keyframes:
+        raise ValueError(f"No timestamped frames to interpolate in {store.path}")
+    if rebuild or not is_snapshot_store(output_path):
+        store_cls = EventStore if events else SnapshotStore
+        output_store = store_cls.create(output_path, store.nodes, store_center=store.store_center,
+                                        lot_id=store.lot_id, overwrite=True)
+    else:
+        output_store = open_store(output_path)
+
+    if len(output_store):
+        last_time = output_store.timestamps[-1]
+        prev_time, prev_occ = last_time, output_store.occupancy(len(output_store) - 1)
+        prev_name = output_store.frame_name(len(output_store) - 1)
+        keyframes = [kf for kf in keyframes if kf[0] > last_time]
+    else:
+        t0, idx0 = keyframes[0]
+        output_store.append(store.occupancy(idx0)[None, :], [t0], [store.frame_name(idx0)])
+        prev_time, prev_occ, prev_name = t0, store.occupancy(idx0), store.frame_name(idx0)
+        keyframes = keyframes[1:]
+
+    occupancy, timestamps, names = [], [], []
+    buffered = 0
+    for t, idx in tqdm(keyframes):
+        occ = store.occupancy(idx)
+        name = store.frame_name(idx)
+        delta = int(t - prev_time)
+
+        if delta > 1:
+            occupancy.append(interpolate_segment(prev_occ, occ, delta))
+            timestamps.append(prev_time + np.arange(1, delta, dtype=np.float64))
+            names.extend(f"{prev_name}_interp_{s}" for s in range(1, delta))
+            buffered += delta - 1
+        occupancy.append(np.asarray(occ, dtype=np.uint8)[None, :])
+        timestamps.append(np.array([t], dtype=np.float64))
+        names.append(name)
+        buffered += 1
+
+        if buffered >= chunk_size:
+            output_store.append(np.concatenate(occupancy), np.concatenate(timestamps), names)
+            occupancy, timestamps, names = [], [], []
+            buffered = 0
+        prev_time, prev_occ, prev_name = t, occ, name
+
+    if buffered:
+        output_store.append(np.concatenate(occupancy), np.concatenate(timestamps), names)
+
+    return output_store
+
+class InterpolatedView:
+    # Read-only stand-in for a SnapshotStore that synthesises the per-second
+    # frames between a store's keyframes on demand instead of storing them.
+
+    def __init__(self, store):
+        self.store = store
+        self.nodes = store.nodes
+        self.meta = store.meta
+
+        keyframe_times = store.timestamps
+        self._keyframes = np.flatnonzero(~np.isnan(keyframe_times))
+        self._keyframe_times = keyframe_times[self._keyframes]
+        steps = np.maximum(np.diff(self._keyframe_times).astype(np.int64), 1)
+        self._steps = np.append(steps, 1)
+        self._offsets = np.concatenate([[0], np.cumsum(self._steps)])
+        self._timestamps = None
+
+    def __len__(self):
+        return int(self._offsets[-1]) if len(self._keyframes) else 0
+
+    @property
+    def num_nodes(self):
+        return self.store.num_nodes
+
+    @property
+    def store_center(self):
+        return self.store.store_center
+
+    @property
+    def lot_id(self):
+        return self.store.lot_id
+
+    @property
+    def coords(self):
+        return self.store.coords
+
+    @property
+    def timestamps(self):
+        if self._timestamps is None:
+            within = np.arange(len(self)) - np.repeat(self._offsets[:-1], self._steps)
+            self._timestamps = np.repeat(self._keyframe_times, self._steps) + within
+        return self._timestamps
+
+    def _locate(self, t):
+        i = int(np.searchsorted(self._offsets, t, side="right")) - 1
+        return i, t - self._offsets[i]
+
+    def occupancy(self, t):
+        i, s = self._locate(t)
+        occ1 = self.store.occupancy(self._keyframes[i])
+        if s == 0:
+            return occ1
+        occ2 = self.store.occupancy(self._keyframes[i + 1])
+        return interpolate_occupancy(occ1.astype(np.float32), occ2.astype(np.float32), s / self._steps[i])
+
+    def frame_name(self, t):
+        i, s = self._locate(t)
+        name = self.store.frame_name(self._keyframes[i])
+        return name if s == 0 else f"{name}_interp_{s}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write one flight or lot store with every second between its keyframes interpolated "
+                    "(or use interpolate=True in build_dynamic_dataset to synthesise them on the fly).")
+    parser.add_argument("store_path")
+    parser.add_argument("output_path", help="Keep it outside the data root so the source frames are not read twice")
+    parser.add_argument("--rebuild", action="store_true", help="Start the output over instead of appending")
+    parser.add_argument("--events", action="store_true", help="Store interpolated seconds as change events")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    output_store = generate_interpolated_store(open_store(args.store_path), args.output_path, rebuild=args.rebuild,
+                                               chunk_size=args.chunk_size, events=args.events)
+    print(f"{args.output_path}: {len(output_store)} frames")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import socket
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+def world_size():
+    return dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+
+def rank():
+    return dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+def is_main_process():
+    return rank() == 0
+
+def init_distributed(backend="gloo"):
+    # Picks up the RANK / WORLD_SIZE / MASTER_ADDR / MASTER_PORT variables set
+    # by torchrun (or launch_local). Without them this is a no-op and training
+    # stays single-process. Each rank gets an equal share of the cores so the
+    # processes don't fight over intra-op threads.
+    size = int(os.environ.get("WORLD_SIZE", 1))
+    if size > 1 and not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+        local_size = int(os.environ.get("LOCAL_WORLD_SIZE", size))
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_size))
+    return rank(), world_size()
+
+def cleanup():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def barrier():
+    if world_size() > 1:
+        dist.barrier()
+
+def shard_dataset(dataset, shard=None, num_shards=None):
+    # Contiguous block of batches per rank, so every shard stays in temporal
+    # order (and lane layouts keep carrying state within a shard). Shards are
+    # truncated to the same length because every rank must take the same
+    # number of optimizer steps.
+    shard = rank() if shard is None else shard
+    num_shards = world_size() if num_shards is None else num_shards
+    if num_shards == 1:
+        return dataset
+    per_shard = len(dataset) // num_shards
+    return dataset[shard * per_shard:(shard + 1) * per_shard]
+
+def all_reduce_mean(value):
+    if world_size() == 1:
+        return value
+    tensor = torch.tensor(float(value), dtype=torch.float64)
+    dist.all_reduce(tensor)
+    return tensor.item() / world_size()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _run_local(local_rank, fn, size, port, args):
+    os.environ.update({
+        "RANK": str(local_rank),
+        "LOCAL_RANK": str(local_rank),
+        "WORLD_SIZE": str(size),
+        "LOCAL_WORLD_SIZE": str(size),
+        "MASTER_ADDR": "127.0.0.1",
+        "MASTER_PORT": str(port),
+    })
+    init_distributed()
+    try:
+        fn(*args)
+    finally:
+        cleanup()
+
+def launch_local(fn, size, *args):
+    # Runs fn(*args) in `size` local processes joined into one gloo group;
+    # handy for trying distributed training on a single machine.
+    mp.spawn(_run_local, args=(fn, size, free_port(), args), nprocs=size, join=True)
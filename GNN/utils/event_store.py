@@ -0,0 +1,269 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from utils.snapshot_store import (
+    META_FILE, NODES_FILE, NODE_COLUMNS, STORE_VERSION, _save_npy_atomic, _write_json_atomic, is_snapshot_store,
+)
+
+EVENT_FORMAT = "events"
+KEYFRAME_FILE = "keyframe.npy"
+
+class EventStore:
+    # Change-event encoding of a SnapshotStore with the same read interface.
+    # Occupancy is kept as the frame-0 keyframe plus a log of
+    # (frame, node, new_state) events sorted by frame, one per spot that
+    # actually changed; per-frame timestamps and names are stored as usual.
+    # Storage grows with the number of changes instead of frames x spots.
+    #
+    # Any frame is rebuilt from the nearest dense checkpoint (one every
+    # checkpoint_interval frames, built on open) by binary-searching the event
+    # log and toggling the spots that changed since. Sequential reads start
+    # from the previous frame instead, so iterating a flight in order costs
+    # O(changes) per frame on top of the copy.
+
+    def __init__(self, path, nodes, meta, keyframe, chunks, checkpoint_interval=256):
+        self.path = path
+        self.nodes = nodes
+        self.meta = meta
+        self.keyframe = keyframe
+        self.checkpoint_interval = checkpoint_interval
+        self._chunks = chunks
+        self._refresh()
+
+    @classmethod
+    def create(cls, path, nodes, store_center=(967, 936), lot_id=None, overwrite=False):
+        if is_snapshot_store(path) and not overwrite:
+            raise FileExistsError(f"Snapshot store already exists at {path}")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, KEYFRAME_FILE)):
+            os.remove(os.path.join(path, KEYFRAME_FILE))
+
+        nodes = nodes[NODE_COLUMNS].sort_values(by="node_id").reset_index(drop=True)
+        nodes.to_csv(os.path.join(path, NODES_FILE), index=False)
+        meta = {
+            "version": STORE_VERSION,
+            "format": EVENT_FORMAT,
+            "lot_id": lot_id,
+            "store_center": [float(store_center[0]), float(store_center[1])],
+            "num_nodes": len(nodes),
+            "num_events": 0,
+            "chunks": [],
+        }
+        _write_json_atomic(os.path.join(path, META_FILE), meta)
+        return cls(path, nodes, meta, None, [])
+
+    @classmethod
+    def open(cls, path, checkpoint_interval=256):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION or meta.get("format") != EVENT_FORMAT:
+            raise ValueError(f"{path} is not an event store")
+        nodes = pd.read_csv(os.path.join(path, NODES_FILE))
+        keyframe_path = os.path.join(path, KEYFRAME_FILE)
+        keyframe = np.load(keyframe_path) if os.path.isfile(keyframe_path) else None
+
+        chunks = []
+        for chunk in meta["chunks"]:
+            prefix = os.path.join(path, chunk["name"])
+            chunks.append({key: np.load(f"{prefix}_{key}.npy") for key in _CHUNK_KEYS})
+        return cls(path, nodes, meta, keyframe, chunks, checkpoint_interval)
+
+    @classmethod
+    def from_store(cls, store, path, chunk_size=4096):
+        # Re-encodes a dense SnapshotStore (or anything with its interface).
+        events = cls.create(path, store.nodes, store_center=store.store_center, lot_id=store.lot_id, overwrite=True)
+        for start in range(0, len(store), chunk_size):
+            stop = min(len(store), start + chunk_size)
+            events.append(store.occupancy_window(start, stop), store.timestamps[start:stop],
+                          [store.frame_name(t) for t in range(start, stop)])
+        return events
+
+    def _refresh(self):
+        def concat(key, dtype):
+            parts = [chunk[key] for chunk in self._chunks]
+            return np.concatenate(parts).astype(dtype, copy=False) if parts else np.empty((0,), dtype=dtype)
+
+        self._timestamps = concat("timestamps", np.float64)
+        self._frames = concat("frames", str)
+        self.event_frames = concat("event_frames", np.int64)
+        self.event_nodes = concat("event_nodes", np.int32)
+        self.event_states = concat("event_states", np.uint8)
+        self._checkpoints = None
+        self._cursor = None
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @property
+    def num_nodes(self):
+        return self.meta["num_nodes"]
+
+    @property
+    def store_center(self):
+        return tuple(self.meta["store_center"])
+
+    @property
+    def lot_id(self):
+        return self.meta.get("lot_id")
+
+    @property
+    def coords(self):
+        return self.nodes[["x_pixel", "y_pixel"]].to_numpy()
+
+    @property
+    def timestamps(self):
+        return self._timestamps
+
+    @property
+    def frame_names(self):
+        return self._frames
+
+    @property
+    def num_events(self):
+        return len(self.event_frames)
+
+    def events(self):
+        # The log as (timestamp, node_id, new_state) arrays in frame order.
+        node_ids = self.nodes["node_id"].to_numpy()
+        return self._timestamps[self.event_frames], node_ids[self.event_nodes], self.event_states
+
+    def frame_name(self, t):
+        return str(self._frames[t])
+
+    def frame_at(self, timestamp):
+        # Last frame recorded at or before timestamp.
+        return int(np.searchsorted(self._timestamps, timestamp, side="right")) - 1
+
+    def _build_checkpoints(self):
+        interval = self.checkpoint_interval
+        starts = np.arange(0, len(self), interval)
+        bounds = np.searchsorted(self.event_frames, starts, side="right")
+        checkpoints = np.empty((len(starts), self.num_nodes), dtype=np.uint8)
+        state = self.keyframe.copy()
+        lo = 0
+        for c, hi in enumerate(bounds):
+            np.bitwise_xor.at(state, self.event_nodes[lo:hi], 1)
+            checkpoints[c] = state
+            lo = hi
+        self._checkpoints = checkpoints
+
+    def occupancy(self, t):
+        t = int(t) + len(self) if t < 0 else int(t)
+        if not 0 <= t < len(self):
+            raise IndexError(f"Frame {t} out of range for {len(self)} frames")
+        if self._checkpoints is None:
+            self._build_checkpoints()
+
+        base_frame = (t // self.checkpoint_interval) * self.checkpoint_interval
+        base = self._checkpoints[t // self.checkpoint_interval]
+        cursor = self._cursor
+        if cursor is not None and base_frame <= cursor[0] <= t:
+            base_frame, base = cursor
+
+        lo = np.searchsorted(self.event_frames, base_frame, side="right")
+        hi = np.searchsorted(self.event_frames, t, side="right")
+        state = base.copy()
+        if t - base_frame == 1:
+            # A spot changes at most once per frame, so plain indexing is safe.
+            state[self.event_nodes[lo:hi]] ^= 1
+        else:
+            np.bitwise_xor.at(state, self.event_nodes[lo:hi], 1)
+        # Read-only like the memory-mapped frames of a SnapshotStore, and shared
+        # with the cursor; one tuple assignment keeps the cursor consistent for
+        # concurrent readers.
+        state.setflags(write=False)
+        self._cursor = (t, state)
+        return state
+
+    def occupancy_window(self, start, stop):
+        stop = min(stop, len(self))
+        if stop <= start:
+            return np.empty((0, self.num_nodes), dtype=np.uint8)
+        toggles = np.zeros((stop - start, self.num_nodes), dtype=np.uint8)
+        lo = np.searchsorted(self.event_frames, start, side="right")
+        hi = np.searchsorted(self.event_frames, stop - 1, side="right")
+        np.bitwise_xor.at(toggles, (self.event_frames[lo:hi] - start, self.event_nodes[lo:hi]), 1)
+        return np.bitwise_xor.accumulate(toggles, axis=0) ^ self.occupancy(start)[None, :]
+
+    def append(self, occupancy, timestamps, frame_names=None, changed=None):
+        # changed, when given, is the (T, N) mask of spots that changed at each
+        # frame (what OccupancyDetector.update reports) and saves diffing the
+        # frames again.
+        occupancy = np.ascontiguousarray(occupancy, dtype=np.uint8).reshape(-1, self.num_nodes)
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        frame_names = np.asarray([""] * len(timestamps) if frame_names is None else frame_names, dtype=str).reshape(-1)
+        if not (len(occupancy) == len(timestamps) == len(frame_names)):
+            raise ValueError("occupancy, timestamps and frame_names must have the same length")
+        if not len(occupancy):
+            return
+
+        first = len(self)
+        if self.keyframe is None:
+            self.keyframe = occupancy[0].copy()
+            if self.path is not None:
+                _save_npy_atomic(os.path.join(self.path, KEYFRAME_FILE), self.keyframe)
+            previous = self.keyframe
+        else:
+            previous = self.occupancy(first - 1)
+
+        if changed is None:
+            changed = np.diff(np.concatenate([previous[None, :], occupancy]), axis=0) != 0
+        else:
+            changed = np.asarray(changed, dtype=bool).reshape(-1, self.num_nodes).copy()
+            if first == 0:
+                changed[0] = False
+        frames, nodes = np.nonzero(changed)
+        chunk = {
+            "timestamps": timestamps,
+            "frames": frame_names,
+            "event_frames": (frames + first).astype(np.int64),
+            "event_nodes": nodes.astype(np.int32),
+            "event_states": occupancy[frames, nodes],
+        }
+
+        if self.path is not None:
+            name = f"chunk_{len(self.meta['chunks']):05d}"
+            prefix = os.path.join(self.path, name)
+            for key in _CHUNK_KEYS:
+                _save_npy_atomic(f"{prefix}_{key}.npy", chunk[key])
+            self.meta["chunks"].append({"name": name, "frames": len(timestamps), "events": len(frames)})
+            self.meta["num_events"] += len(frames)
+            _write_json_atomic(os.path.join(self.path, META_FILE), self.meta)
+
+        self._chunks.append(chunk)
+        self._refresh()
+
+    def writer(self, chunk_size=1024):
+        return EventWriter(self, chunk_size=chunk_size)
+
+_CHUNK_KEYS = ("timestamps", "frames", "event_frames", "event_nodes", "event_states")
+
+class EventWriter:
+    # SnapshotWriter for event stores; pass the detector's changed mask with
+    # each frame so events are taken straight from the differencing step.
+
+    def __init__(self, store, chunk_size=1024):
+        self.store = store
+        self.chunk_size = chunk_size
+        self._occupancy, self._timestamps, self._frames, self._changed = [], [], [], []
+
+    def write(self, occupancy, timestamp=np.nan, frame_name="", changed=None):
+        self._occupancy.append(np.asarray(occupancy, dtype=np.uint8))
+        self._timestamps.append(np.nan if timestamp is None else timestamp)
+        self._frames.append(frame_name)
+        self._changed.append(changed)
+        if len(self._occupancy) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._occupancy:
+            changed = None if any(c is None for c in self._changed) else np.stack(self._changed)
+            self.store.append(np.stack(self._occupancy), self._timestamps, self._frames, changed=changed)
+        self._occupancy, self._timestamps, self._frames, self._changed = [], [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
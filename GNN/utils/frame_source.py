@@ -0,0 +1,165 @@
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utils.timestamps import extract_base_time_from_folder, frame_timestamp
+from utils.snapshot_store import datetime_to_timestamp
+from utils import profiling
+
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+_END = object()
+
+def is_video(path):
+    return os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+def list_image_files(image_folder):
+    return sorted(f for f in os.listdir(image_folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+def list_video_files(folder):
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(VIDEO_EXTENSIONS))
+
+class FrameSource:
+    # Yields (name, timestamp, gray_frame) from an image folder or from one or
+    # more video files, decoding on background threads into a bounded queue so
+    # decode overlaps with whatever consumes the frames.
+    #
+    # With crop_positions the frames are cropped to the bounding box of the
+    # lot's node positions (plus margin) before an optional downscale;
+    # transform_positions maps node pixels into the cropped/scaled frames.
+    #
+    # With start_after, frames named before it are skipped (video frames are
+    # grabbed but not decoded), resuming at the frame of that name.
+
+    def __init__(self, paths, flight_name="", crop_positions=None, margin=16, scale=1.0, queue_size=16,
+                 num_threads=2, frame_step=1, start_after=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.flight_name = flight_name
+        self.scale = scale
+        self.queue_size = queue_size
+        self.num_threads = num_threads
+        self.frame_step = frame_step
+        self.start_after = start_after
+
+        if crop_positions is not None:
+            crop_positions = np.asarray(crop_positions)
+            self.origin = np.maximum(crop_positions.min(axis=0) - margin, 0).astype(np.int64)
+            self.extent = (crop_positions.max(axis=0) + margin + 1).astype(np.int64)
+        else:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.extent = None
+
+    def transform_positions(self, positions):
+        positions = (np.asarray(positions) - self.origin) * self.scale
+        return np.round(positions).astype(np.int64)
+
+    def _prepare(self, frame):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.extent is not None:
+            x0, y0 = self.origin
+            x1, y1 = self.extent
+            frame = frame[y0:y1, x0:x1]
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(frame)
+
+    def _read_image(self, img_path):
+        with profiling.span("decode_frame"):
+            frame = cv2.imread(img_path)
+            if frame is None:
+                raise IOError(f"Could not decode image {img_path}")
+            return self._prepare(frame)
+
+    def _iter_folder(self, folder):
+        image_files = list_image_files(folder)[::self.frame_step]
+        if self.start_after is not None:
+            image_files = [f for f in image_files if os.path.splitext(f)[0] >= self.start_after]
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            pending = []
+            for img_file in image_files:
+                future = executor.submit(self._read_image, os.path.join(folder, img_file))
+                pending.append((img_file, future))
+                if len(pending) >= self.queue_size:
+                    yield self._image_result(*pending.pop(0))
+            for img_file, future in pending:
+                yield self._image_result(img_file, future)
+
+    def _image_result(self, img_file, future):
+        name = os.path.splitext(img_file)[0]
+        timestamp = frame_timestamp(self.flight_name, name) if self.flight_name else np.nan
+        return name, timestamp, future.result()
+
+    def _decode_video(self, video_path, frames, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        capture = cv2.VideoCapture(video_path)
+        try:
+            if not capture.isOpened():
+                raise IOError(f"Could not open video {video_path}")
+            fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            stem = os.path.splitext(os.path.basename(video_path))[0]
+            base_time = extract_base_time_from_folder(stem)
+            base_timestamp = datetime_to_timestamp(base_time)
+
+            index = 0
+            while not stop.is_set():
+                skip = self.start_after is not None and f"{stem}_{index:06d}" < self.start_after
+                if skip or index % self.frame_step:
+                    if not capture.grab():
+                        break
+                    index += 1
+                    continue
+                with profiling.span("decode_frame"):
+                    ok, frame = capture.read()
+                    frame = self._prepare(frame) if ok else None
+                if not ok:
+                    break
+                name = f"{stem}_{index:06d}"
+                if not put((name, base_timestamp + index / fps, frame)):
+                    break
+                index += 1
+        except Exception as e:
+            put(e)
+        finally:
+            capture.release()
+            put(_END)
+
+    def _iter_video(self, video_path):
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode_video, args=(video_path, frames, stop), daemon=True)
+        decoder.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            decoder.join()
+
+    def __iter__(self):
+        for path in self.paths:
+            if os.path.isdir(path):
+                yield from self._iter_folder(path)
+            elif is_video(path):
+                stem = os.path.splitext(os.path.basename(path))[0]
+                if self.start_after is not None and f"{stem}_999999" < self.start_after:
+                    continue
+                yield from self._iter_video(path)
+            else:
+                raise ValueError(f"Unsupported frame source: {path}")
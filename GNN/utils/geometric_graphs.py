@@ -1,41 +1,26 @@
 import os
+import argparse
 import pandas as pd
 import numpy as np
-from torch_geometric_temporal import temporal_signal_split
-from torch_geometric_temporal.signal import DynamicGraphTemporalSignalBatch
-from scipy.spatial import distance_matrix
-from datetime import datetime, timedelta
-import math
+from datetime import timedelta
+from utils import profiling
+from utils.topology import build_topology
+from utils.lots import LotRegistry, find_lot_config
+from utils.snapshot_store import SnapshotStore, open_store
+from utils.timestamps import (
+    compute_time_features, compute_time_features_from_datetime, extract_base_time_from_folder, extract_frame_number,
+    frame_timestamp,
+)
+from utils.manifest import DatasetManifest, split_boundaries, update_manifest
+from utils.create_synthetic_graphs import InterpolatedView
+
+# torch, torch_geometric(_temporal) and the batching/partition modules are
+# imported inside the functions that build datasets, so the preprocessing
+# helpers here (CSV enrichment, store conversion, sequences) load without them.
 
 def compute_distance(x, y, x_center, y_center):
     return np.sqrt((x - x_center) ** 2 + (y - y_center) ** 2)
 
-def extract_base_time_from_folder(folder_name):
-    try:
-        parts = folder_name.split("_")
-        timestamp_str = parts[1]
-        dt = datetime.strptime(timestamp_str, "%Y%m%d%H%M%S")
-        return dt
-    except Exception as e:
-        print(f"Error parsing base time from folder {folder_name}: {e}")
-        return None
-
-def extract_frame_number(file_name):
-    try:
-        parts = file_name.split("_")
-        frame_str = parts[2]  # e.g., 0001
-        return int(frame_str)
-    except Exception as e:
-        print(f"Error parsing frame number from file {file_name}: {e}")
-        return 0
-
-def compute_time_features_from_datetime(dt):
-    time_of_day = dt.hour + dt.minute / 60 + dt.second / 3600
-    normalized_time = time_of_day / 24.0
-    sin_time = math.sin(2 * math.pi * normalized_time)
-    cos_time = math.cos(2 * math.pi * normalized_time)
-    return sin_time, cos_time
-
 def process_csv_file(csv_path, folder_name, file_name, x_center=967, y_center=936):
     df = pd.read_csv(csv_path)
 
@@ -55,18 +40,88 @@ def process_csv_file(csv_path, folder_name, file_name, x_center=967, y_center=93
 
     df.to_csv(csv_path, index=False)
 
-def process_all_partitions(root_dir):
+def partition_lot(root_dir, folder, x_center=967, y_center=936):
+    # (lot_id, store_center) from a lot.json in the partition or the root;
+    # without one every partition is its own lot around the default center.
+    lot = find_lot_config(os.path.join(root_dir, folder), root_dir) or {}
+    return lot.get("lot_id", folder), tuple(lot.get("store_center", (x_center, y_center)))
+
+def process_all_partitions(root_dir, x_center=967, y_center=936):
+    # CSVs enriched by an earlier run (same mtime as recorded in the manifest)
+    # are left alone, so only newly labelled frames are rewritten.
+    manifest = DatasetManifest.load(root_dir)
     for folder in os.listdir(root_dir):
         folder_path = os.path.join(root_dir, folder)
         labels_dir = os.path.join(folder_path, "labels")
 
         if not os.path.isdir(labels_dir):
             continue
+        _, (lot_x, lot_y) = partition_lot(root_dir, folder, x_center, y_center)
 
         for file in os.listdir(labels_dir):
             if file.endswith(".csv"):
                 csv_path = os.path.join(labels_dir, file)
-                process_csv_file(csv_path, folder, file)
+                if manifest.is_partition_processed(csv_path):
+                    continue
+                process_csv_file(csv_path, folder, file, lot_x, lot_y)
+                manifest.record_partition(csv_path)
+    manifest.save()
+
+def convert_partition_to_store(labels_dir, folder_name, store_path, x_center=967, y_center=936, lot_id=None):
+    files = sorted(file for file in os.listdir(labels_dir) if file.endswith(".csv"))
+    if not files:
+        return None
+
+    frames = [pd.read_csv(os.path.join(labels_dir, file)).sort_values(by="node_id") for file in files]
+    store = SnapshotStore.create(store_path, frames[0], store_center=(x_center, y_center),
+                                 lot_id=lot_id or folder_name, overwrite=True)
+    store.append(
+        np.stack([df["is_occupied"].to_numpy() for df in frames]),
+        [frame_timestamp(folder_name, file) for file in files],
+        [os.path.splitext(file)[0] for file in files],
+    )
+    return store
+
+def convert_all_partitions(root_dir, store_dirname="snapshots", x_center=967, y_center=936):
+    stores = []
+    for folder in sorted(os.listdir(root_dir)):
+        labels_dir = os.path.join(root_dir, folder, "labels")
+
+        if not os.path.isdir(labels_dir):
+            continue
+
+        store_path = os.path.join(root_dir, folder, store_dirname)
+        lot_id, (lot_x, lot_y) = partition_lot(root_dir, folder, x_center, y_center)
+        store = convert_partition_to_store(labels_dir, folder, store_path, lot_x, lot_y, lot_id=lot_id)
+        if store is not None:
+            stores.append(store)
+    return stores
+
+def num_node_features(horizons=None):
+    # Forecasting ahead only makes sense from the currently observed state, so
+    # multi-horizon snapshots carry occupancy as a fifth input feature.
+    return 4 if horizons is None else 5
+
+def process_store_frame(store, static_features, time_features, t, include_occupancy=False):
+    occupancy = store.occupancy(t)
+    features = np.empty((store.num_nodes, 5 if include_occupancy else 4), dtype=np.float32)
+    features[:, :2] = static_features
+    features[:, 2:4] = time_features[t]
+    if include_occupancy:
+        features[:, 4] = occupancy
+    labels = occupancy.astype(np.float32)
+    return features, labels
+
+def horizon_target_indices(timestamps, horizons, tolerance=60.0):
+    # For every frame, the first frame at or after each horizon (in minutes),
+    # and whether all horizons land on a frame within tolerance seconds.
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    target_times = timestamps[:, None] + np.asarray(horizons, dtype=np.float64)[None, :] * 60.0
+    indices = np.searchsorted(timestamps, target_times, side="left")
+    in_range = indices < len(timestamps)
+    indices = np.minimum(indices, max(0, len(timestamps) - 1))
+    valid = in_range & (np.abs(timestamps[indices] - target_times) <= tolerance)
+    return indices, valid.all(axis=1)
 
 def process_csv(csv_path):
     df = pd.read_csv(csv_path).sort_values(by="node_id")
@@ -81,36 +136,170 @@ def process_csv(csv_path):
 
     return features, labels, coords
 
-def build_dynamic_dataset(root_dir, batch_size=32, dist_threshold=75):
-    csv_paths = sorted([
-        os.path.join(subdir, file)
-        for subdir, _, files in os.walk(root_dir)
-        for file in files if file.endswith(".csv") and file != "nodes.csv"
-    ])
+class StoreSequence:
+    def __init__(self, store, dist_threshold, horizons=None, horizon_tolerance=60.0, lot=None):
+        # Static features and topology belong to the lot, so every flight of a
+        # lot shares one copy.
+        self.store = store
+        self.horizons = horizons
+        self.lot = lot if lot is not None else LotRegistry().register_store(store)
+        self.static_features = self.lot.static_features
+        self.time_features = compute_time_features(store.timestamps)
+        self.edge_index, self.edge_weight = self.lot.topology(dist_threshold)
+
+        # Multi-horizon sequences only keep frames whose every horizon is
+        # observed; targets are (N, H) occupancy at those future frames.
+        if horizons is not None and len(store):
+            target_indices, valid = horizon_target_indices(store.timestamps, horizons, horizon_tolerance)
+            self._frames = np.flatnonzero(valid)
+            self._target_indices = target_indices[valid]
+        else:
+            self._frames = None
+
+    def __len__(self):
+        if self.horizons is not None:
+            return 0 if self._frames is None else len(self._frames)
+        return len(self.store)
 
-    def build_graph(path):
-        x, y, coords = process_csv(path)
+    def snapshot(self, t):
+        if self.horizons is None:
+            x, y = process_store_frame(self.store, self.static_features, self.time_features, t)
+            return x, y, self.edge_index, self.edge_weight
 
-        dist_mat = distance_matrix(coords, coords)
-        edge_list = []
-        edge_weights = []
+        x, _ = process_store_frame(self.store, self.static_features, self.time_features, self._frames[t],
+                                   include_occupancy=True)
+        y = np.stack([self.store.occupancy(i) for i in self._target_indices[t]], axis=1).astype(np.float32)
+        return x, y, self.edge_index, self.edge_weight
 
-        sigma = dist_threshold / 2
+class CsvSequence:
+    def __init__(self, csv_paths, dist_threshold):
+        self.csv_paths = csv_paths
+        self.dist_threshold = dist_threshold
 
-        for i in range(len(coords)):
-            for j in range(len(coords)):
-                if i != j and dist_mat[i, j] <= dist_threshold:
-                    edge_list.append([i, j])
-                    weight = np.exp(- (dist_mat[i, j] ** 2) / (2 * sigma ** 2))
-                    edge_weights.append(weight)
+    def __len__(self):
+        return len(self.csv_paths)
 
-        edge_index = np.array(edge_list).T.astype(np.int64)
-        edge_weight = np.array(edge_weights, dtype=np.float32)
+    def snapshot(self, t):
+        with profiling.span("process_csv"):
+            x, y, coords = process_csv(self.csv_paths[t])
+        edge_index, edge_weight = build_topology(coords, self.dist_threshold)
         return x, y, edge_index, edge_weight
 
+def build_sequences(root_dir, dist_threshold=75, horizons=None, interpolate=False, registry=None,
+                    refresh_manifest=True):
+    # Stores come from the dataset manifest rather than a walk of the whole
+    # tree, and lot topologies from its on-disk graph cache. With
+    # refresh_manifest=False the manifest is only read, e.g. on DDP ranks
+    # after rank 0 has brought it up to date.
+    manifest = update_manifest(root_dir) if refresh_manifest else DatasetManifest.load(root_dir)
+    registry = registry if registry is not None else LotRegistry()
+    if registry.cache_dir is None:
+        registry.cache_dir = manifest.cache_dir
+    store_paths = manifest.store_paths
+    if store_paths:
+        stores = [open_store(path) for path in store_paths]
+        if interpolate:
+            stores = [InterpolatedView(store) for store in stores]
+        return [StoreSequence(store, dist_threshold, horizons, lot=registry.register_store(store)) for store in stores]
+
+    if horizons is not None:
+        raise ValueError("Multi-horizon targets need timestamped snapshot stores; run convert_all_partitions first")
+
+    # One sequence per partition folder so frames of different flights (and
+    # lots) are never treated as one continuous recording.
+    sequences = []
+    for subdir, _, files in sorted(os.walk(root_dir)):
+        csv_paths = sorted(os.path.join(subdir, file) for file in files if file.endswith(".csv") and file != "nodes.csv")
+        if csv_paths:
+            sequences.append(CsvSequence(csv_paths, dist_threshold))
+    return sequences
+
+def build_dataset(root_dir, dist_thresholds=(75,), from_labels=False, store_dirname="snapshots"):
+    # Everything training reads besides the frames themselves, done ahead of
+    # time: label folders converted to stores (from_labels), the manifest
+    # brought up to date and every lot's topology written to the graph cache
+    # for each threshold. Needs no torch.
+    if from_labels:
+        convert_all_partitions(root_dir, store_dirname)
+    manifest = update_manifest(root_dir, store_dirname)
+    registry = LotRegistry(cache_dir=manifest.cache_dir)
+    for path in manifest.store_paths:
+        registry.register_store(open_store(path))
+    for lot in registry:
+        for dist_threshold in dist_thresholds:
+            edge_index, _ = lot.topology(dist_threshold)
+            print(f"Lot {lot.lot_id!r}: {lot.num_nodes} spots, {edge_index.shape[1]} edges at {dist_threshold:g}")
+    splits = manifest.splits or {"train_end": 0, "val_end": 0}
+    print(f"{manifest.num_frames} frames in {len(manifest.stores)} stores; train/val/test split at frames "
+          f"{splits['train_end']} and {splits['val_end']}")
+    return manifest, registry
+
+def split_dataset(dataset):
+    from torch_geometric_temporal import temporal_signal_split
+    train_dataset, val_dataset = temporal_signal_split(dataset, train_ratio=0.8)
+    val_dataset, test_dataset = temporal_signal_split(val_dataset, train_ratio=0.5)
+    return train_dataset, val_dataset, test_dataset
+
+def split_frames(sequences, **kwargs):
+    # Splits on frame boundaries before batching so that lane layouts keep the
+    # same chronological train/val/test order as temporal_signal_split.
+    from utils.temporal_dataset import LazyTemporalDataset
+    num_frames = sum(len(seq) for seq in sequences)
+    train_end, val_end = split_boundaries(num_frames)
+    return tuple(
+        LazyTemporalDataset(sequences, frame_range=frame_range, **kwargs)
+        for frame_range in ((0, train_end), (train_end, val_end), (val_end, num_frames))
+    )
+
+def split_cluster_frames(sequences, dist_threshold, cluster_size, halo_hops=2, **kwargs):
+    # split_frames for lots too large to run whole: train and val batches are
+    # spatial clusters (with halos) of every frame in their range, while the
+    # test split stays full-lot graphs for stitched inference with
+    # ClusterPredictor.
+    from utils.temporal_dataset import LazyTemporalDataset
+    from utils.partition import cluster_sequences
+    if not all(getattr(seq, "lot", None) is not None for seq in sequences):
+        raise ValueError("Cluster mini-batching needs snapshot stores with lots; run ingest first")
+    lengths = [len(seq) for seq in sequences]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    num_frames = int(offsets[-1])
+    train_end, val_end = split_boundaries(num_frames)
+
+    def frame_ranges(lo, hi):
+        return [(max(lo - offset, 0), min(hi - offset, length)) for offset, length in zip(offsets[:-1], lengths)]
+
+    return (
+        LazyTemporalDataset(cluster_sequences(sequences, frame_ranges(0, train_end), dist_threshold, cluster_size,
+                                              halo_hops), **kwargs),
+        LazyTemporalDataset(cluster_sequences(sequences, frame_ranges(train_end, val_end), dist_threshold,
+                                              cluster_size, halo_hops), **kwargs),
+        LazyTemporalDataset(sequences, frame_range=(val_end, num_frames), **kwargs),
+    )
+
+def build_dynamic_dataset(root_dir, batch_size=32, dist_threshold=75, lazy=False, prefetch=2, num_workers=2,
+                          layout="sequential", horizons=None, interpolate=False, registry=None, cluster_size=None,
+                          halo_hops=2, refresh_manifest=True):
+    # Pass a LotRegistry to get back the lots the dataset was built from.
+    # cluster_size caps the spots per training graph (see split_cluster_frames).
+    sequences = build_sequences(root_dir, dist_threshold, horizons, interpolate, registry, refresh_manifest)
+
+    if cluster_size is not None:
+        return split_cluster_frames(sequences, dist_threshold, cluster_size, halo_hops, batch_size=batch_size,
+                                    prefetch=prefetch, num_workers=num_workers, layout=layout)
+
+    if layout == "lanes":
+        return split_frames(sequences, batch_size=batch_size, prefetch=prefetch,
+                            num_workers=num_workers, layout=layout)
+
+    if lazy:
+        from utils.temporal_dataset import LazyTemporalDataset
+        dataset = LazyTemporalDataset(sequences, batch_size=batch_size, prefetch=prefetch, num_workers=num_workers)
+        return split_dataset(dataset)
+
+    graphs = (seq.snapshot(t) for seq in sequences for t in range(len(seq)))
+
     x_all, y_all, ei_all, ew_all = [], [], [], []
-    for path in csv_paths:
-        x, y, ei, ew = build_graph(path)
+    for x, y, ei, ew in graphs:
         x_all.append(x)
         y_all.append(y)
         ei_all.append(ei)
@@ -136,11 +325,12 @@ def build_dynamic_dataset(root_dir, batch_size=32, dist_threshold=75):
             node_offset += x.shape[0]
 
         batched_x.append(np.vstack(x_batch))
-        batched_y.append(np.hstack(y_batch))
+        batched_y.append(np.concatenate(y_batch))
         batched_ei.append(np.hstack(ei_batch))
         batched_ew.append(np.hstack(ew_batch))
         batched_batch.append(np.hstack(batch_idx))
 
+    from torch_geometric_temporal.signal import DynamicGraphTemporalSignalBatch
     dataset = DynamicGraphTemporalSignalBatch(
         edge_indices=batched_ei,
         edge_weights=batched_ew,
@@ -149,7 +339,17 @@ def build_dynamic_dataset(root_dir, batch_size=32, dist_threshold=75):
         batches=batched_batch,
     )
 
-    train_dataset, val_dataset = temporal_signal_split(dataset, train_ratio=0.8)
-    val_dataset, test_dataset = temporal_signal_split(val_dataset, train_ratio=0.5)
+    return split_dataset(dataset)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare a data root for training: stores, manifest and graph cache.")
+    parser.add_argument("data_root", nargs="?", default="Data")
+    parser.add_argument("--dist-threshold", type=float, nargs="+", default=[75])
+    parser.add_argument("--from-labels", action="store_true", help="Convert <flight>/labels CSV folders to stores first")
+    parser.add_argument("--store-dirname", default="snapshots")
+    args = parser.parse_args(argv)
+
+    build_dataset(args.data_root, args.dist_threshold, from_labels=args.from_labels, store_dirname=args.store_dirname)
 
-    return train_dataset, val_dataset, test_dataset
\ No newline at end of file
+if __name__ == "__main__":
+    main()
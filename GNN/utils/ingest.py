@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from utils.create_graphs import label_frames
+from utils.frame_source import list_image_files, list_video_files
+from utils.lots import find_lot_config
+from utils.manifest import update_manifest
+from utils.snapshot_store import _write_json_atomic, is_snapshot_store
+from utils import profiling
+
+MARKER_FILE = "ingest.json"
+
+def find_frame_sources(flight_dir):
+    # A flight is either a folder of extracted frames (in frames/ or at the top
+    # level) or one or more DJI videos decoded directly.
+    frames_dir = os.path.join(flight_dir, "frames")
+    frame_folder = frames_dir if os.path.isdir(frames_dir) else flight_dir
+    image_files = list_image_files(frame_folder)
+    if image_files:
+        return [frame_folder], [os.path.join(frame_folder, f) for f in image_files]
+
+    videos = [os.path.join(flight_dir, f) for f in list_video_files(flight_dir)]
+    return videos, list(videos)
+
+def find_nodes_csv(flight_dir, data_root):
+    for candidate in (os.path.join(flight_dir, "nodes.csv"), os.path.join(data_root, "nodes.csv")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def discover_flights(data_root):
+    flights = []
+    for name in sorted(os.listdir(data_root)):
+        flight_dir = os.path.join(data_root, name)
+        if os.path.isdir(flight_dir) and find_frame_sources(flight_dir)[0]:
+            flights.append(name)
+    return flights
+
+def source_signature(paths, params):
+    # Cheap change detection: names, sizes and mtimes of every input plus the
+    # labelling parameters. Any new, edited or removed frame changes the hash.
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def read_marker(output_dir):
+    try:
+        with open(os.path.join(output_dir, MARKER_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_marker(output_dir, payload):
+    _write_json_atomic(os.path.join(output_dir, MARKER_FILE), payload)
+
+def plan_flight(flight, data_root, output_root, params):
+    flight_dir = os.path.join(data_root, flight)
+    sources, frame_inputs = find_frame_sources(flight_dir)
+    nodes_csv = find_nodes_csv(flight_dir, data_root)
+    static_inputs = [nodes_csv] if nodes_csv is not None else []
+
+    # Flights sharing the root nodes.csv belong to one lot unless a lot.json
+    # says otherwise; a flight with its own nodes.csv is its own lot.
+    lot = find_lot_config(flight_dir, data_root) or {}
+    if "path" in lot:
+        static_inputs.append(lot["path"])
+    shared_nodes = nodes_csv is not None and os.path.dirname(nodes_csv) != flight_dir
+    default_lot = os.path.basename(os.path.normpath(data_root)) if shared_nodes else flight
+
+    output_dir = os.path.join(output_root, flight)
+    return {
+        "flight": flight,
+        "sources": sources,
+        "nodes_csv": nodes_csv,
+        "output_dir": output_dir,
+        "store_path": os.path.join(output_dir, "snapshots"),
+        "lot_id": lot.get("lot_id", default_lot),
+        "store_center": lot.get("store_center", params["store_center"]),
+        "signature": source_signature(frame_inputs + static_inputs, params),
+        "static_signature": source_signature(static_inputs, params),
+        "frame_inputs": sorted(frame_inputs),
+    }
+
+def ingest_mode(plan, force=False):
+    # "skip" when nothing changed, "append" when the flight only gained frame
+    # files after the ones already labelled (same nodes, lot and parameters,
+    # earlier inputs untouched), otherwise "rebuild".
+    marker = read_marker(plan["output_dir"])
+    if force or marker is None:
+        return "rebuild"
+    if marker.get("signature") == plan["signature"]:
+        return "skip"
+    num_inputs = marker.get("num_inputs", 0)
+    if (marker.get("static_signature") == plan["static_signature"]
+            and 0 < num_inputs < len(plan["frame_inputs"])
+            and source_signature(plan["frame_inputs"][:num_inputs], {}) == marker.get("inputs_signature")
+            and is_snapshot_store(plan["store_path"])):
+        return "append"
+    return "rebuild"
+
+def _init_worker(profile=False):
+    # One flight per process; keep OpenCV from spawning its own thread pool in
+    # every worker and oversubscribing the machine.
+    import cv2
+    cv2.setNumThreads(1)
+    if profile:
+        profiling.enable()
+
+def ingest_flight(plan, params, mode="rebuild"):
+    start = time.perf_counter()
+    if plan["nodes_csv"] is None:
+        raise FileNotFoundError(f"No nodes.csv for flight {plan['flight']}")
+
+    os.makedirs(plan["output_dir"], exist_ok=True)
+
+    # decode -> occupancy labelling -> feature enrichment -> storage. Store
+    # distance and time-of-day features are derived from the store centre and
+    # per-frame timestamps recorded here, so the store is ready for
+    # build_dynamic_dataset without another pass over the frames.
+    previous = read_marker(plan["output_dir"]) if mode == "append" else None
+    store = label_frames(
+        plan["sources"], plan["nodes_csv"], plan["store_path"],
+        window_size=params["window_size"], diff_threshold=params["diff_threshold"],
+        flight_name=plan["flight"], store_center=plan["store_center"], scale=params["scale"],
+        frame_step=params["frame_step"], verbose=False, lot_id=plan["lot_id"], append=mode == "append",
+        events=params.get("store_format") == "events",
+    )
+    added = len(store) - (previous["frames"] if previous else 0)
+
+    elapsed = time.perf_counter() - start
+    write_marker(plan["output_dir"], {
+        "flight": plan["flight"],
+        "lot_id": plan["lot_id"],
+        "signature": plan["signature"],
+        "static_signature": plan["static_signature"],
+        "inputs_signature": source_signature(plan["frame_inputs"], {}),
+        "num_inputs": len(plan["frame_inputs"]),
+        "frames": len(store),
+        "seconds": round(elapsed, 3),
+        "params": params,
+    })
+    status = "appended" if mode == "append" else "processed"
+    result = {"flight": plan["flight"], "status": status, "frames": added, "seconds": elapsed}
+    if profiling.is_enabled():
+        # Worker buffers die with the process; ship this flight's spans and
+        # counters back with the result.
+        result["profile"] = profiling.drain()
+    return result
+
+def ingest(data_root, output_root=None, workers=None, window_size=8, diff_threshold=25, store_center=(967, 936),
+           scale=1.0, frame_step=1, force=False, events=False, profile=False):
+    # profile traces decode and labelling in every worker; the merged trace
+    # and summary are written at the end (profile_trace.json / _summary.json).
+    output_root = output_root or data_root
+    profile = profile or profiling.is_enabled()
+    if profile:
+        profiling.enable()
+    params = {
+        "window_size": window_size,
+        "diff_threshold": diff_threshold,
+        "store_center": list(store_center),
+        "scale": scale,
+        "frame_step": frame_step,
+    }
+    # Only recorded when set, so switching to event stores relabels flights
+    # but existing dense-store markers stay valid.
+    if events:
+        params["store_format"] = "events"
+
+    plans = [plan_flight(flight, data_root, output_root, params) for flight in discover_flights(data_root)]
+    modes = [ingest_mode(plan, force) for plan in plans]
+    results = [
+        {"flight": plan["flight"], "status": "skipped", "frames": 0, "seconds": 0.0}
+        for plan, mode in zip(plans, modes) if mode == "skip"
+    ]
+    pending = [(plan, mode) for plan, mode in zip(plans, modes) if mode != "skip"]
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(profile,)) as executor:
+            futures = {executor.submit(ingest_flight, plan, params, mode): plan for plan, mode in pending}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Ingesting flights"):
+                plan = futures[future]
+                try:
+                    result = future.result()
+                    profiling.merge(result.pop("profile", None))
+                    results.append(result)
+                except Exception as e:
+                    print(f"Error ingesting flight {plan['flight']}: {e}")
+                    results.append({"flight": plan["flight"], "status": "failed", "frames": 0, "seconds": 0.0})
+
+    processed = sum(r["status"] == "processed" for r in results)
+    appended = sum(r["status"] == "appended" for r in results)
+    skipped = sum(r["status"] == "skipped" for r in results)
+    failed = sum(r["status"] == "failed" for r in results)
+    print(f"Ingested {processed} flights, appended to {appended}, skipped {skipped} up to date, {failed} failed")
+    update_manifest(output_root)
+    if profile:
+        profiling.finish(trace_path="profile_trace.json", summary_path="profile_summary.json")
+    return sorted(results, key=lambda r: r["flight"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label and store every DJI flight under a data root in parallel.")
+    parser.add_argument("data_root")
+    parser.add_argument("--output-root", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--window-size", type=int, default=8)
+    parser.add_argument("--diff-threshold", type=float, default=25)
+    parser.add_argument("--store-center", type=float, nargs=2, default=(967, 936))
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--frame-step", type=int, default=1)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--events", action="store_true", help="Store per-spot change events instead of full frames")
+    parser.add_argument("--profile", action="store_true", help="Write profile_trace.json and profile_summary.json")
+    args = parser.parse_args(argv)
+
+    ingest(args.data_root, args.output_root, workers=args.workers, window_size=args.window_size,
+           diff_threshold=args.diff_threshold, store_center=tuple(args.store_center), scale=args.scale,
+           frame_step=args.frame_step, force=args.force, events=args.events, profile=args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import json
+import numpy as np
+from utils.topology import build_topology
+
+LOT_FILE = "lot.json"
+STATIC_COLUMNS = ["node_id", "x_pixel", "y_pixel", "is_handicapped"]
+
+def lot_static_features(nodes, store_center):
+    x_center, y_center = store_center
+    store_distance = np.sqrt((nodes["x_pixel"].to_numpy() - x_center) ** 2 + (nodes["y_pixel"].to_numpy() - y_center) ** 2)
+    store_distance_norm = (store_distance - store_distance.min()) / (store_distance.max() - store_distance.min() + 1e-8)
+    return np.column_stack([nodes["is_handicapped"].to_numpy(), store_distance_norm]).astype(np.float32)
+
+def find_lot_config(*directories):
+    # lot.json ({"lot_id": ..., "store_center": [x, y]}) next to a flight or at
+    # the data root names the lot a flight belongs to and its store entrance.
+    for directory in directories:
+        path = os.path.join(directory, LOT_FILE)
+        if os.path.isfile(path):
+            with open(path) as f:
+                config = json.load(f)
+            config["path"] = path
+            return config
+    return None
+
+class Lot:
+    # Everything about a lot that does not change between frames: its node
+    # table, store entrance, static node features and radius-graph topology
+    # (built once per dist_threshold).
+
+    def __init__(self, lot_id, index, nodes, store_center, cache_dir=None):
+        self.lot_id = lot_id
+        self.cache_dir = cache_dir
+        self.index = index
+        self.nodes = nodes.sort_values(by="node_id").reset_index(drop=True)
+        self.store_center = tuple(float(c) for c in store_center)
+        self.coords = self.nodes[["x_pixel", "y_pixel"]].to_numpy(dtype=np.float64)
+        self.static_features = lot_static_features(self.nodes, self.store_center)
+        self._topology = {}
+        self._partitions = {}
+
+    @property
+    def num_nodes(self):
+        return len(self.nodes)
+
+    def topology(self, dist_threshold):
+        if dist_threshold not in self._topology:
+            self._topology[dist_threshold] = build_topology(self.coords, dist_threshold, self.cache_dir)
+        return self._topology[dist_threshold]
+
+    def partitions(self, dist_threshold, max_nodes, halo_hops=2):
+        # Spatial clusters of at most max_nodes core spots plus their halos
+        # on the dist_threshold graph (see utils.partition, imported here so
+        # lot lookups during ingest do not load torch).
+        from utils.partition import partition_graph
+        key = (dist_threshold, max_nodes, halo_hops)
+        if key not in self._partitions:
+            edge_index, edge_weight = self.topology(dist_threshold)
+            self._partitions[key] = partition_graph(self.coords, edge_index, edge_weight, max_nodes, halo_hops)
+        return self._partitions[key]
+
+    def matches(self, nodes, store_center):
+        nodes = nodes.sort_values(by="node_id").reset_index(drop=True)
+        return (
+            len(nodes) == self.num_nodes
+            and np.allclose(tuple(store_center), self.store_center)
+            and all(np.array_equal(nodes[c].to_numpy(), self.nodes[c].to_numpy()) for c in STATIC_COLUMNS)
+        )
+
+class LotRegistry:
+    # Lots are registered once, however many flights or stores reference
+    # them; snapshots refer to a lot by lot_id (or its integer index, which is
+    # what batches carry). With cache_dir, lot topologies persist on disk.
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._lots = {}
+
+    def register(self, lot_id, nodes, store_center):
+        lot = self._lots.get(lot_id)
+        if lot is not None:
+            if not lot.matches(nodes, store_center):
+                raise ValueError(f"Lot {lot_id!r} is already registered with a different node table or store center")
+            return lot
+        lot = Lot(lot_id, len(self._lots), nodes, store_center, self.cache_dir)
+        self._lots[lot_id] = lot
+        return lot
+
+    def register_store(self, store):
+        lot_id = store.lot_id
+        if lot_id is None:
+            path = getattr(store, "path", None)
+            lot_id = str(path) if path is not None else f"lot_{len(self._lots)}"
+        return self.register(lot_id, store.nodes, store.store_center)
+
+    def __getitem__(self, lot_id):
+        return self._lots[lot_id]
+
+    def __contains__(self, lot_id):
+        return lot_id in self._lots
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __iter__(self):
+        return iter(self._lots.values())
+
+    @property
+    def lot_ids(self):
+        return list(self._lots)
@@ -0,0 +1,129 @@
+import os
+import json
+from utils.snapshot_store import META_FILE, _write_json_atomic, find_snapshot_stores, is_snapshot_store
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+GRAPH_CACHE_DIR = "graph_cache"
+
+def split_boundaries(num_frames, train_ratio=0.8, val_ratio=0.5):
+    # Chronological train/val/test frame boundaries, the same proportions as
+    # temporal_signal_split(0.8) followed by temporal_signal_split(0.5).
+    train_end = int(train_ratio * num_frames)
+    val_end = train_end + int(val_ratio * (num_frames - train_end))
+    return train_end, val_end
+
+def read_store_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+class DatasetManifest:
+    # manifest.json at a data root: every snapshot store the dataset is built
+    # from (in the order flights were added, with their lot and frame count),
+    # the label CSVs process_all_partitions has already enriched, and the
+    # current split boundaries. Lot topologies live next to it in graph_cache/.
+    #
+    # update() only looks at stores it already knows plus the flight folders
+    # directly under the root, so a new flight costs one meta.json read and
+    # nothing already processed is walked or parsed again.
+
+    def __init__(self, root_dir, payload=None):
+        self.root_dir = root_dir
+        self.payload = payload or {"version": MANIFEST_VERSION, "stores": [], "partitions": {}, "splits": None}
+
+    @classmethod
+    def load(cls, root_dir):
+        path = os.path.join(root_dir, MANIFEST_FILE)
+        try:
+            with open(path) as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return cls(root_dir)
+        if payload.get("version") != MANIFEST_VERSION:
+            return cls(root_dir)
+        return cls(root_dir, payload)
+
+    @property
+    def path(self):
+        return os.path.join(self.root_dir, MANIFEST_FILE)
+
+    @property
+    def cache_dir(self):
+        return os.path.join(self.root_dir, GRAPH_CACHE_DIR)
+
+    @property
+    def stores(self):
+        return self.payload["stores"]
+
+    @property
+    def store_paths(self):
+        return [os.path.join(self.root_dir, entry["path"]) for entry in self.stores]
+
+    @property
+    def num_frames(self):
+        return sum(entry["frames"] for entry in self.stores)
+
+    @property
+    def splits(self):
+        return self.payload["splits"]
+
+    def save(self):
+        _write_json_atomic(self.path, self.payload)
+
+    def _candidate_stores(self, store_dirname):
+        if not self.stores:
+            return find_snapshot_stores(self.root_dir)
+        candidates = [os.path.join(self.root_dir, entry["path"]) for entry in self.stores]
+        for folder in sorted(os.listdir(self.root_dir)):
+            path = os.path.join(self.root_dir, folder, store_dirname)
+            if is_snapshot_store(path):
+                candidates.append(path)
+        return candidates
+
+    def update(self, store_dirname="snapshots"):
+        # Refreshes frame counts of known stores (ingest appends to them),
+        # drops stores that disappeared, appends new ones after the existing
+        # entries and recomputes the split boundaries. Returns the new and
+        # grown stores as {relative path: frames added}.
+        known = {entry["path"]: entry for entry in self.stores}
+        stores, changes = [], {}
+        for path in self._candidate_stores(store_dirname):
+            rel_path = os.path.relpath(path, self.root_dir)
+            if any(entry["path"] == rel_path for entry in stores) or not is_snapshot_store(path):
+                continue
+            meta = read_store_meta(path)
+            frames = sum(chunk["frames"] for chunk in meta["chunks"])
+            previous = known.get(rel_path, {}).get("frames", 0)
+            if frames != previous:
+                changes[rel_path] = frames - previous
+            stores.append({"path": rel_path, "lot_id": meta.get("lot_id"), "frames": frames,
+                           "chunks": len(meta["chunks"])})
+        for rel_path, entry in known.items():
+            if not any(store["path"] == rel_path for store in stores):
+                changes[rel_path] = -entry["frames"]
+
+        self.payload["stores"] = stores
+        num_frames = self.num_frames
+        train_end, val_end = split_boundaries(num_frames)
+        self.payload["splits"] = {"num_frames": num_frames, "train_end": train_end, "val_end": val_end}
+        return changes
+
+    def is_partition_processed(self, csv_path):
+        rel_path = os.path.relpath(csv_path, self.root_dir)
+        return self.payload["partitions"].get(rel_path) == os.stat(csv_path).st_mtime_ns
+
+    def record_partition(self, csv_path):
+        self.payload["partitions"][os.path.relpath(csv_path, self.root_dir)] = os.stat(csv_path).st_mtime_ns
+
+def update_manifest(root_dir, store_dirname="snapshots", verbose=True):
+    # Only writes manifest.json when something changed (or it is new), so an
+    # up-to-date data root is left untouched.
+    manifest = DatasetManifest.load(root_dir)
+    changes = manifest.update(store_dirname)
+    if changes or not os.path.isfile(manifest.path):
+        manifest.save()
+    if verbose and changes:
+        added = sum(max(frames, 0) for frames in changes.values())
+        print(f"Dataset manifest: {len(changes)} stores changed, {added} new frames, "
+              f"{manifest.num_frames} frames in {len(manifest.stores)} stores")
+    return manifest
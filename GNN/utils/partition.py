@@ -0,0 +1,207 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+# ClusterPredictor runs a lot whole once any of its partitions reaches this
+# share of the lot's spots.
+FULL_LOT_FRACTION = 0.9
+
+class GraphPartition:
+    # One spatial cluster of a lot: its core nodes, the halo nodes within
+    # halo_hops of them on the distance-threshold graph, and the induced
+    # subgraph relabelled so the core comes first. Only core outputs are
+    # trained on and stitched back; the halo just gives them their
+    # neighbourhood.
+
+    def __init__(self, core, halo, edge_index, edge_weight):
+        self.nodes = np.concatenate([core, halo]).astype(np.int64)
+        self.num_core = len(core)
+        self.edge_index = edge_index
+        self.edge_weight = edge_weight
+        self.core_mask = np.arange(len(self.nodes)) < self.num_core
+        for array in (self.nodes, self.edge_index, self.edge_weight, self.core_mask):
+            array.setflags(write=False)
+
+    @property
+    def core(self):
+        return self.nodes[:self.num_core]
+
+    @property
+    def num_nodes(self):
+        return len(self.nodes)
+
+def spatial_clusters(coords, max_nodes):
+    # Recursive coordinate bisection: split at the median of the wider axis
+    # until every cluster has at most max_nodes spots. Clusters come out
+    # spatially compact, which keeps their halos thin.
+    coords = np.asarray(coords, dtype=np.float64)
+    pending, clusters = [np.arange(len(coords))], []
+    while pending:
+        nodes = pending.pop()
+        if len(nodes) <= max_nodes:
+            clusters.append(np.sort(nodes))
+            continue
+        points = coords[nodes]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = nodes[np.argsort(points[:, axis], kind="stable")]
+        half = len(order) // 2
+        pending.extend([order[half:], order[:half]])
+    return sorted(clusters, key=lambda c: c[0])
+
+def receptive_field(model):
+    # Hops one snapshot's prediction can see: K - 1 per GConvGRU layer. A halo
+    # one hop wider also gets every used node's degree (and so the normalised
+    # Laplacian) right, making stitched predictions match the full graph.
+    return sum(layer.K - 1 for layer in (model.recurrent1, model.recurrent2, model.recurrent3))
+
+def partition_graph(coords, edge_index, edge_weight, max_nodes, halo_hops=2):
+    num_nodes = len(coords)
+    clusters = spatial_clusters(coords, max_nodes)
+    if len(clusters) == 1:
+        return [GraphPartition(clusters[0], np.empty(0, dtype=np.int64), edge_index, edge_weight)]
+
+    # All halos at once: one sparse (N, C) membership matrix grown one hop
+    # per multiplication with the adjacency.
+    adjacency = sp.csr_matrix((np.ones(edge_index.shape[1], dtype=np.float32), (edge_index[1], edge_index[0])),
+                              shape=(num_nodes, num_nodes))
+    membership = sp.csr_matrix((
+        np.ones(num_nodes, dtype=np.float32),
+        (np.concatenate(clusters), np.repeat(np.arange(len(clusters)), [len(c) for c in clusters])),
+    ), shape=(num_nodes, len(clusters)))
+    reach = membership
+    for _ in range(halo_hops):
+        reach = reach + adjacency @ reach
+        reach.data[:] = 1.0
+    reach = reach.tocsc()
+
+    partitions = []
+    local = np.full(num_nodes, -1, dtype=np.int64)
+    for c, core in enumerate(clusters):
+        members = reach.indices[reach.indptr[c]:reach.indptr[c + 1]]
+        halo = np.setdiff1d(members, core)
+        nodes = np.concatenate([core, halo])
+        local[nodes] = np.arange(len(nodes))
+        keep = (local[edge_index[0]] >= 0) & (local[edge_index[1]] >= 0)
+        sub_index = local[edge_index[:, keep]]
+        partitions.append(GraphPartition(core, halo, sub_index, edge_weight[keep]))
+        local[nodes] = -1
+    return partitions
+
+class ClusterSequence:
+    # A StoreSequence (or anything with its snapshot interface) restricted to
+    # one partition of its lot and to frames [start, stop). Batches built
+    # from it carry core_mask so losses ignore the halo nodes.
+
+    def __init__(self, sequence, partition, start=0, stop=None):
+        self.sequence = sequence
+        self.partition = partition
+        self.lot = getattr(sequence, "lot", None)
+        self.start = start
+        self.stop = len(sequence) if stop is None else stop
+        self.core_mask = partition.core_mask
+
+    def __len__(self):
+        return max(0, self.stop - self.start)
+
+    def snapshot(self, t):
+        x, y, _, _ = self.sequence.snapshot(self.start + t)
+        nodes = self.partition.nodes
+        return x[nodes], y[nodes], self.partition.edge_index, self.partition.edge_weight
+
+def cluster_sequences(sequences, frame_ranges, dist_threshold, max_nodes, halo_hops=2):
+    # Frame ranges are cut per recording before clustering, so a temporal
+    # split stays temporal and every cluster of a frame lands in one split.
+    clustered = []
+    for seq, (start, stop) in zip(sequences, frame_ranges):
+        if stop <= start:
+            continue
+        for partition in seq.lot.partitions(dist_threshold, max_nodes, halo_hops):
+            clustered.append(ClusterSequence(seq, partition, start, stop))
+    return clustered
+
+class ClusterPredictor:
+    # Full-graph inference with bounded memory: every lot graph in a batch is
+    # run one partition at a time and the core outputs are stitched back into
+    # node order. Stands in for the model wherever step() is used (evaluation,
+    # live forecasting); the state is kept per (graph slot, partition).
+    #
+    # Pass the halo_hops the model was trained with to keep partitions (and
+    # memory) bounded by max_nodes. None uses the receptive-field halo, which
+    # reproduces full-graph predictions exactly but can reach the whole lot.
+
+    def __init__(self, model, registry, dist_threshold, max_nodes, halo_hops=None):
+        self.model = model
+        self.registry = registry
+        self.dist_threshold = dist_threshold
+        self.max_nodes = max_nodes
+        self.halo_hops = receptive_field(model) + 1 if halo_hops is None else halo_hops
+        self._tensors = {}
+        self._operators = {}
+
+    def eval(self):
+        self.model.eval()
+        return self
+
+    def _lot_partitions(self, lot):
+        partitions = lot.partitions(self.dist_threshold, self.max_nodes, self.halo_hops)
+        largest = max(partition.num_nodes for partition in partitions)
+        if len(partitions) > 1 and largest >= FULL_LOT_FRACTION * lot.num_nodes:
+            # A halo that reaches (nearly) the whole lot makes every partition
+            # a full graph; run the lot once instead of once per cluster.
+            print(f"Warning: a {self.halo_hops}-hop halo covers up to {largest} of {lot.num_nodes} spots of lot "
+                  f"{lot.lot_id!r}; running it as one graph instead of {len(partitions)} clusters")
+            edge_index, edge_weight = lot.topology(self.dist_threshold)
+            partitions = [GraphPartition(np.arange(lot.num_nodes), np.empty(0, dtype=np.int64), edge_index,
+                                         edge_weight)]
+        return partitions
+
+    def _partition_tensors(self, lot, device):
+        key = (lot.lot_id, device)
+        if key not in self._tensors:
+            self._tensors[key] = [
+                (partition, torch.as_tensor(np.array(partition.nodes), device=device),
+                 torch.as_tensor(np.array(partition.edge_index), device=device),
+                 torch.as_tensor(np.array(partition.edge_weight), device=device))
+                for partition in self._lot_partitions(lot)
+            ]
+        return self._tensors[key]
+
+    @torch.no_grad()
+    def step(self, snapshot, state=None):
+        state = {} if state is None else state
+        batch = snapshot.batch if getattr(snapshot, "batch", None) is not None else \
+            torch.zeros(snapshot.x.shape[0], dtype=torch.long)
+        counts = torch.bincount(batch.cpu()).tolist()
+        lots = list(self.registry)
+        lot_ids = snapshot.lot.tolist() if getattr(snapshot, "lot", None) is not None else [-1] * len(counts)
+
+        # Lanes batches flag graphs whose lane starts a new recording; they
+        # start from zero state like the unpartitioned model does.
+        resets = snapshot.reset.tolist() if getattr(snapshot, "reset", None) is not None else [False] * len(counts)
+        state = {key: value for key, value in state.items()
+                 if not resets[key[0] if isinstance(key, tuple) else key]}
+
+        probs, new_state, offset = [], {}, 0
+        for g, (count, lot_index) in enumerate(zip(counts, lot_ids)):
+            x = snapshot.x[offset:offset + count]
+            if lot_index < 0:
+                edges = (snapshot.edge_index[0] >= offset) & (snapshot.edge_index[0] < offset + count)
+                out, new_state[g] = self.model(x, snapshot.edge_index[:, edges] - offset, snapshot.edge_attr[edges],
+                                               state=state.get(g), return_state=True)
+                probs.append(torch.sigmoid(out))
+            else:
+                graph_probs = None
+                lot = lots[lot_index]
+                for p, (partition, nodes, edge_index, edge_weight) in enumerate(self._partition_tensors(lot, x.device)):
+                    # Swap in this partition's cached graph operator so it is
+                    # built once per partition, not once per call.
+                    self.model._operator = self._operators.get((lot.lot_id, p))
+                    out, new_state[g, p] = self.model(x[nodes], edge_index, edge_weight, state=state.get((g, p)),
+                                                      return_state=True)
+                    self._operators[lot.lot_id, p] = self.model._operator
+                    if graph_probs is None:
+                        graph_probs = out.new_empty((count,) + out.shape[1:])
+                    graph_probs[nodes[:partition.num_core]] = torch.sigmoid(out[:partition.num_core])
+                probs.append(graph_probs)
+            offset += count
+        return torch.cat(probs), new_state
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from collections import defaultdict
+
+# Process-wide spans and counters. Everything is a no-op until enable() is
+# called (or BRAINWAVE_PROFILE=1 is set): span() then hands back one shared
+# null context and count() returns immediately, so instrumented hot paths cost
+# a function call and a flag check.
+
+_enabled = os.environ.get("BRAINWAVE_PROFILE", "") not in ("", "0")
+_sync_cuda = False
+_lock = threading.Lock()
+_events = []
+_counters = defaultdict(float)
+_counter_events = []
+_peaks = {}
+_start_ns = time.perf_counter_ns()
+_pid = os.getpid()
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if _sync_cuda:
+            import torch
+            torch.cuda.synchronize()
+        end = time.perf_counter_ns()
+        with _lock:
+            _events.append((self.name, self.start, end - self.start, _pid, threading.get_ident(), self.args))
+        return False
+
+def enable(sync_cuda=False):
+    # sync_cuda synchronises the device when a span closes so GPU work is
+    # attributed to the span that launched it, at the cost of some overlap.
+    global _enabled, _sync_cuda
+    if sync_cuda:
+        import torch
+        sync_cuda = torch.cuda.is_available()
+    reset()
+    _enabled, _sync_cuda = True, sync_cuda
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    global _start_ns, _pid
+    _pid = os.getpid()
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _counter_events.clear()
+        _peaks.clear()
+        _start_ns = time.perf_counter_ns()
+
+def span(name, **args):
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+def count(name, value=1):
+    if not _enabled:
+        return
+    now = time.perf_counter_ns()
+    with _lock:
+        _counters[name] += value
+        _counter_events.append((name, now, _counters[name], _pid))
+
+def peak(name, value):
+    if not _enabled:
+        return
+    with _lock:
+        _peaks[name] = max(_peaks.get(name, value), value)
+
+def record_memory():
+    # Host RSS high-water mark (ru_maxrss is KiB on Linux, bytes on macOS) and
+    # the CUDA allocator's, when torch has initialised a device.
+    if not _enabled:
+        return
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak("rss_mb", rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024)
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+        peak("cuda_mb", torch.cuda.max_memory_allocated() / 2 ** 20)
+
+def summary():
+    elapsed = (time.perf_counter_ns() - _start_ns) / 1e9
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+        peaks = dict(_peaks)
+
+    spans = defaultdict(list)
+    for name, _, duration, _, _, _ in events:
+        spans[name].append(duration / 1e9)
+    return {
+        "elapsed_s": elapsed,
+        "spans": {
+            name: {
+                "count": len(durations),
+                "total_s": sum(durations),
+                "mean_ms": 1000.0 * sum(durations) / len(durations),
+                "max_ms": 1000.0 * max(durations),
+            }
+            for name, durations in spans.items()
+        },
+        "counters": {name: {"total": value, "per_s": value / elapsed if elapsed else 0.0}
+                     for name, value in counters.items()},
+        "peaks": peaks,
+    }
+
+def print_summary():
+    report = summary()
+    print(f"Profile over {report['elapsed_s']:.2f}s")
+    if report["spans"]:
+        print(f"{'span':<28} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}")
+        for name, s in sorted(report["spans"].items(), key=lambda item: -item[1]["total_s"]):
+            print(f"{name:<28} {s['count']:>8} {s['total_s']:>10.3f} {s['mean_ms']:>10.3f} {s['max_ms']:>10.3f}")
+    if report["counters"]:
+        print(f"{'counter':<28} {'total':>12} {'per s':>12}")
+        for name, c in sorted(report["counters"].items()):
+            print(f"{name:<28} {c['total']:>12.0f} {c['per_s']:>12.1f}")
+    for name, value in sorted(report["peaks"].items()):
+        print(f"peak {name}: {value:.1f}")
+    return report
+
+def export_chrome_trace(path):
+    # Chrome trace event format; open in chrome://tracing or Perfetto.
+    with _lock:
+        events = list(_events)
+        counter_events = list(_counter_events)
+
+    trace = [
+        {"name": name, "ph": "X", "ts": (start - _start_ns) / 1000.0, "dur": duration / 1000.0,
+         "pid": pid, "tid": tid, "args": args}
+        for name, start, duration, pid, tid, args in events
+    ]
+    trace += [
+        {"name": name, "ph": "C", "ts": (now - _start_ns) / 1000.0, "pid": pid, "args": {name: value}}
+        for name, now, value, pid in counter_events
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+def drain():
+    # Hands over (and clears) everything recorded so far, e.g. for a worker
+    # process to return with its result; merge() folds it into the parent.
+    # perf_counter is the system-wide monotonic clock on Linux, so spans from
+    # different processes line up on one timeline, each under its own pid.
+    record_memory()
+    with _lock:
+        data = {"events": list(_events), "counters": dict(_counters), "counter_events": list(_counter_events),
+                "peaks": dict(_peaks)}
+        _events.clear()
+        _counters.clear()
+        _counter_events.clear()
+        _peaks.clear()
+    return data
+
+def merge(data):
+    if not _enabled or not data:
+        return
+    with _lock:
+        _events.extend(data["events"])
+        _counter_events.extend(data["counter_events"])
+        for name, value in data["counters"].items():
+            _counters[name] += value
+        for name, value in data["peaks"].items():
+            _peaks[name] = max(_peaks.get(name, value), value)
+
+def finish(trace_path=None, summary_path=None):
+    # End-of-run hook: memory high-water mark, summary table and exports.
+    if not _enabled:
+        return None
+    record_memory()
+    report = print_summary()
+    if trace_path:
+        export_chrome_trace(trace_path)
+    if summary_path:
+        with open(summary_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
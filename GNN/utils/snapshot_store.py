@@ -0,0 +1,248 @@
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import timezone
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+NODES_FILE = "nodes.csv"
+NODE_COLUMNS = ["node_id", "x_pixel", "y_pixel", "is_handicapped"]
+
+def datetime_to_timestamp(dt):
+    if dt is None:
+        return np.nan
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+def is_snapshot_store(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+def find_snapshot_stores(root_dir):
+    return sorted(
+        subdir for subdir, _, files in os.walk(root_dir)
+        if META_FILE in files and is_snapshot_store(subdir)
+    )
+
+def open_store(path, mmap_mode="r"):
+    # Opens a store in whichever encoding it was written: dense chunks
+    # (SnapshotStore) or keyframe plus change events (EventStore).
+    with open(os.path.join(path, META_FILE)) as f:
+        store_format = json.load(f).get("format", "dense")
+    if store_format == "events":
+        from utils.event_store import EventStore
+        return EventStore.open(path)
+    return SnapshotStore.open(path, mmap_mode=mmap_mode)
+
+def _unique_tmp_path(path, suffix=".tmp"):
+    # A temp file of its own next to path, so concurrent writers of the same
+    # file (e.g. every DDP rank) never rename each other's temp file away.
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=suffix,
+                                    dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    return tmp_path
+
+def _replace_atomic(write, path, suffix=".tmp"):
+    tmp_path = _unique_tmp_path(path, suffix)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_json_atomic(path, payload):
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f, indent=2)
+    _replace_atomic(write, path)
+
+def _save_npy_atomic(path, array):
+    _replace_atomic(lambda tmp_path: np.save(tmp_path, array), path, suffix=".tmp.npy")
+
+class SnapshotStore:
+    # A lot/flight on disk: one static node table plus (T, N) occupancy and
+    # (T,) timestamps split into append-only .npy chunks that are memory-mapped
+    # on open. Timestamps are seconds since the epoch (naive datetimes are
+    # treated as UTC) and NaN when unknown.
+
+    def __init__(self, path, nodes, meta, chunks):
+        self.path = path
+        self.nodes = nodes
+        self.meta = meta
+        self._chunks = chunks
+        self._refresh_offsets()
+
+    @classmethod
+    def create(cls, path, nodes, store_center=(967, 936), lot_id=None, overwrite=False):
+        if is_snapshot_store(path) and not overwrite:
+            raise FileExistsError(f"Snapshot store already exists at {path}")
+        os.makedirs(path, exist_ok=True)
+
+        nodes = nodes[NODE_COLUMNS].sort_values(by="node_id").reset_index(drop=True)
+        nodes.to_csv(os.path.join(path, NODES_FILE), index=False)
+
+        meta = {
+            "version": STORE_VERSION,
+            "lot_id": lot_id,
+            "store_center": [float(store_center[0]), float(store_center[1])],
+            "num_nodes": len(nodes),
+            "chunks": [],
+        }
+        _write_json_atomic(os.path.join(path, META_FILE), meta)
+        return cls(path, nodes, meta, [])
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported snapshot store version in {path}: {meta.get('version')}")
+        nodes = pd.read_csv(os.path.join(path, NODES_FILE))
+
+        chunks = []
+        for chunk in meta["chunks"]:
+            prefix = os.path.join(path, chunk["name"])
+            chunks.append({
+                "occupancy": np.load(prefix + "_occupancy.npy", mmap_mode=mmap_mode),
+                "timestamps": np.load(prefix + "_timestamps.npy"),
+                "frames": np.load(prefix + "_frames.npy"),
+            })
+        return cls(path, nodes, meta, chunks)
+
+    @classmethod
+    def from_arrays(cls, nodes, occupancy, timestamps, frame_names=None, store_center=(967, 936), lot_id=None):
+        nodes = nodes[NODE_COLUMNS].sort_values(by="node_id").reset_index(drop=True)
+        meta = {
+            "version": STORE_VERSION,
+            "lot_id": lot_id,
+            "store_center": [float(store_center[0]), float(store_center[1])],
+            "num_nodes": len(nodes),
+            "chunks": [],
+        }
+        store = cls(None, nodes, meta, [])
+        if len(occupancy):
+            store._chunks.append(_make_chunk(occupancy, timestamps, frame_names, len(nodes)))
+            store._refresh_offsets()
+        return store
+
+    def _refresh_offsets(self):
+        sizes = [len(chunk["timestamps"]) for chunk in self._chunks]
+        self._offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+        self._timestamps = None
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    @property
+    def num_nodes(self):
+        return self.meta["num_nodes"]
+
+    @property
+    def store_center(self):
+        return tuple(self.meta["store_center"])
+
+    @property
+    def lot_id(self):
+        return self.meta.get("lot_id")
+
+    @property
+    def coords(self):
+        return self.nodes[["x_pixel", "y_pixel"]].to_numpy()
+
+    @property
+    def timestamps(self):
+        if self._timestamps is None:
+            if self._chunks:
+                self._timestamps = np.concatenate([chunk["timestamps"] for chunk in self._chunks])
+            else:
+                self._timestamps = np.empty((0,), dtype=np.float64)
+        return self._timestamps
+
+    @property
+    def frame_names(self):
+        if not self._chunks:
+            return np.empty((0,), dtype=str)
+        return np.concatenate([chunk["frames"] for chunk in self._chunks])
+
+    def _locate(self, t):
+        c = int(np.searchsorted(self._offsets, t, side="right")) - 1
+        return self._chunks[c], t - self._offsets[c]
+
+    def occupancy(self, t):
+        chunk, i = self._locate(t)
+        return chunk["occupancy"][i]
+
+    def frame_name(self, t):
+        chunk, i = self._locate(t)
+        return str(chunk["frames"][i])
+
+    def occupancy_window(self, start, stop):
+        parts = []
+        for c, chunk in enumerate(self._chunks):
+            lo, hi = self._offsets[c], self._offsets[c + 1]
+            if hi <= start or lo >= stop:
+                continue
+            parts.append(chunk["occupancy"][max(start, lo) - lo:min(stop, hi) - lo])
+        if not parts:
+            return np.empty((0, self.num_nodes), dtype=np.uint8)
+        return np.concatenate(parts)
+
+    def append(self, occupancy, timestamps, frame_names=None):
+        chunk = _make_chunk(occupancy, timestamps, frame_names, self.num_nodes)
+        if len(chunk["timestamps"]) == 0:
+            return
+
+        if self.path is not None:
+            name = f"chunk_{len(self.meta['chunks']):05d}"
+            prefix = os.path.join(self.path, name)
+            _save_npy_atomic(prefix + "_occupancy.npy", chunk["occupancy"])
+            _save_npy_atomic(prefix + "_timestamps.npy", chunk["timestamps"])
+            _save_npy_atomic(prefix + "_frames.npy", chunk["frames"])
+            self.meta["chunks"].append({"name": name, "frames": len(chunk["timestamps"])})
+            _write_json_atomic(os.path.join(self.path, META_FILE), self.meta)
+
+        self._chunks.append(chunk)
+        self._refresh_offsets()
+
+    def writer(self, chunk_size=1024):
+        return SnapshotWriter(self, chunk_size=chunk_size)
+
+def _make_chunk(occupancy, timestamps, frame_names, num_nodes):
+    occupancy = np.ascontiguousarray(occupancy, dtype=np.uint8).reshape(-1, num_nodes)
+    timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+    if frame_names is None:
+        frame_names = [""] * len(timestamps)
+    frame_names = np.asarray(frame_names, dtype=str).reshape(-1)
+    if not (len(occupancy) == len(timestamps) == len(frame_names)):
+        raise ValueError("occupancy, timestamps and frame_names must have the same length")
+    return {"occupancy": occupancy, "timestamps": timestamps, "frames": frame_names}
+
+class SnapshotWriter:
+    # Buffers frames in memory and appends them to the store one chunk at a time.
+
+    def __init__(self, store, chunk_size=1024):
+        self.store = store
+        self.chunk_size = chunk_size
+        self._occupancy = []
+        self._timestamps = []
+        self._frames = []
+
+    def write(self, occupancy, timestamp=np.nan, frame_name=""):
+        self._occupancy.append(np.asarray(occupancy, dtype=np.uint8))
+        self._timestamps.append(np.nan if timestamp is None else timestamp)
+        self._frames.append(frame_name)
+        if len(self._occupancy) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._occupancy:
+            self.store.append(np.stack(self._occupancy), self._timestamps, self._frames)
+        self._occupancy, self._timestamps, self._frames = [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
@@ -0,0 +1,172 @@
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from torch_geometric.data import Batch
+from utils import profiling
+
+class LazyTemporalDataset:
+    # Drop-in replacement for DynamicGraphTemporalSignalBatch that keeps only an
+    # index of (sequence, frame) pairs and assembles each batched snapshot on
+    # demand. Slicing returns a view over a range of batches, so
+    # temporal_signal_split works without copying any frames.
+    #
+    # layout="sequential" packs consecutive frames into each batch, like
+    # build_dynamic_dataset always has. layout="lanes" cuts the frame range
+    # into batch_size contiguous lanes and batch b holds frame b of every lane,
+    # so node i of one batch is the same spot one frame later in the next and
+    # recurrent state can be carried across batches. Lanes are cut from the
+    # concatenated timeline, so one can run from a recording into the next;
+    # lanes batches carry `reset`, true for every graph whose lane does not
+    # continue the previous batch's frame (lane start, new flight or lot), and
+    # carry_state (model.GNN) starts those graphs from zero state.
+    #
+    # Frames of different lots batch together as block-diagonal graphs; each
+    # batch carries the registry index of every graph's lot in `lot` (-1 for
+    # sequences without one). When sequences are cluster subgraphs, batches
+    # also carry `mask`, true for the core nodes the loss should cover.
+
+    def __init__(self, sequences, batch_size=32, prefetch=2, num_workers=2, layout="sequential",
+                 frame_range=None, batch_ids=None):
+        if layout not in ("sequential", "lanes"):
+            raise ValueError(f"Unknown batch layout: {layout}")
+        self.sequences = sequences
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.num_workers = num_workers
+        self.layout = layout
+
+        lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+        seq_ids = np.repeat(np.arange(len(sequences)), lengths)
+        frame_ids = np.concatenate([np.arange(n) for n in lengths]) if len(lengths) else np.empty(0, np.int64)
+        start, stop = frame_range if frame_range is not None else (0, len(seq_ids))
+        self._seq_ids = seq_ids[start:stop]
+        self._frame_ids = frame_ids[start:stop]
+
+        num_frames = len(self._seq_ids)
+        if layout == "lanes":
+            self._num_lanes = min(batch_size, num_frames)
+            self._lane_length = num_frames // max(1, self._num_lanes)
+            num_batches = self._lane_length
+        else:
+            num_batches = -(-num_frames // batch_size)
+        self._batch_ids = np.arange(num_batches) if batch_ids is None else np.asarray(batch_ids)
+        self.snapshot_count = len(self._batch_ids)
+        self._topology = None
+
+    @property
+    def num_frames(self):
+        return len(self._seq_ids)
+
+    def _view(self, batch_ids):
+        view = LazyTemporalDataset.__new__(LazyTemporalDataset)
+        view.__dict__.update(self.__dict__)
+        view._batch_ids = batch_ids
+        view.snapshot_count = len(batch_ids)
+        return view
+
+    def _lane_positions(self, batch_id):
+        return np.arange(self._num_lanes) * self._lane_length + batch_id
+
+    def _lane_resets(self, batch_id):
+        positions = self._lane_positions(batch_id)
+        if batch_id == 0:
+            return np.ones(len(positions), dtype=bool)
+        return ((self._seq_ids[positions] != self._seq_ids[positions - 1])
+                | (self._frame_ids[positions] != self._frame_ids[positions - 1] + 1))
+
+    def _frames(self, batch_id):
+        if self.layout == "lanes":
+            positions = self._lane_positions(batch_id)
+            return zip(self._seq_ids[positions], self._frame_ids[positions])
+        start = batch_id * self.batch_size
+        stop = min(start + self.batch_size, len(self._seq_ids))
+        return zip(self._seq_ids[start:stop], self._frame_ids[start:stop])
+
+    def _assemble(self, batch_id):
+        with profiling.span("assemble_batch"):
+            snapshot = self._build_batch(batch_id)
+        profiling.count("snapshots", snapshot.num_graphs)
+        return snapshot
+
+    def _batch_topology(self, topologies, sizes):
+        # Consecutive batches usually stack the same per-lot topologies, so the
+        # block-diagonal tensors are reused as long as the exact same arrays
+        # come back. Handing out the same tensor objects also lets the model
+        # keep its cached graph operator across steps.
+        cached = self._topology
+        if cached is not None and len(cached[0]) == len(topologies):
+            if all(ei is cached_ei and ew is cached_ew for (ei, ew), (cached_ei, cached_ew) in zip(topologies, cached[0])):
+                return cached[1]
+
+        offsets = np.cumsum([0] + sizes[:-1])
+        tensors = (
+            torch.from_numpy(np.hstack([ei + offset for (ei, _), offset in zip(topologies, offsets)])),
+            torch.from_numpy(np.hstack([ew for _, ew in topologies])),
+            torch.from_numpy(np.repeat(np.arange(len(sizes)), sizes)),
+        )
+        self._topology = (topologies, tensors)
+        return tensors
+
+    def _build_batch(self, batch_id):
+        x_batch, y_batch, topologies, sizes, lots, masks = [], [], [], [], [], []
+
+        for s, t in self._frames(batch_id):
+            sequence = self.sequences[s]
+            x, y, ei, ew = sequence.snapshot(t)
+            lot = getattr(sequence, "lot", None)
+            lots.append(-1 if lot is None else lot.index)
+            masks.append(getattr(sequence, "core_mask", None))
+            x_batch.append(x)
+            y_batch.append(y)
+            topologies.append((ei, ew))
+            sizes.append(x.shape[0])
+
+        edge_index, edge_attr, batch = self._batch_topology(topologies, sizes)
+        snapshot = Batch(
+            x=torch.from_numpy(np.vstack(x_batch)),
+            edge_index=edge_index,
+            edge_attr=edge_attr,
+            y=torch.from_numpy(np.concatenate(y_batch)),
+            batch=batch,
+            lot=torch.tensor(lots, dtype=torch.long),
+        )
+        if self.layout == "lanes":
+            snapshot.reset = torch.from_numpy(self._lane_resets(batch_id))
+        if any(mask is not None for mask in masks):
+            snapshot.mask = torch.from_numpy(np.concatenate([
+                np.ones(size, dtype=bool) if mask is None else mask for mask, size in zip(masks, sizes)
+            ]))
+        return snapshot
+
+    def __len__(self):
+        return self.snapshot_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._view(self._batch_ids[index])
+        return self._assemble(self._batch_ids[index])
+
+    def __iter__(self):
+        if self.prefetch <= 0 or self.num_workers <= 0:
+            for batch_id in self._batch_ids:
+                yield self._assemble(batch_id)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        try:
+            pending = []
+            batch_ids = iter(self._batch_ids)
+            for batch_id in batch_ids:
+                pending.append(executor.submit(self._assemble, batch_id))
+                if len(pending) > self.prefetch:
+                    break
+
+            while pending:
+                with profiling.span("data_wait"):
+                    snapshot = pending.pop(0).result()
+                next_id = next(batch_ids, None)
+                if next_id is not None:
+                    pending.append(executor.submit(self._assemble, next_id))
+                yield snapshot
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,47 @@
+import math
+import numpy as np
+from datetime import datetime, timedelta
+from utils.snapshot_store import datetime_to_timestamp
+
+# Frame/flight naming and time-of-day helpers shared by labelling, ingest and
+# dataset building; numpy only, so the preprocessing entry points import them
+# without pulling in torch.
+
+def extract_base_time_from_folder(folder_name):
+    try:
+        parts = folder_name.split("_")
+        timestamp_str = parts[1]
+        dt = datetime.strptime(timestamp_str, "%Y%m%d%H%M%S")
+        return dt
+    except Exception as e:
+        print(f"Error parsing base time from folder {folder_name}: {e}")
+        return None
+
+def extract_frame_number(file_name):
+    try:
+        parts = file_name.split("_")
+        frame_str = parts[2]  # e.g., 0001
+        return int(frame_str)
+    except Exception as e:
+        print(f"Error parsing frame number from file {file_name}: {e}")
+        return 0
+
+def compute_time_features_from_datetime(dt):
+    time_of_day = dt.hour + dt.minute / 60 + dt.second / 3600
+    normalized_time = time_of_day / 24.0
+    sin_time = math.sin(2 * math.pi * normalized_time)
+    cos_time = math.cos(2 * math.pi * normalized_time)
+    return sin_time, cos_time
+
+def compute_time_features(timestamps):
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    normalized_time = np.mod(timestamps, 86400.0) / 86400.0
+    sin_time = np.nan_to_num(np.sin(2 * np.pi * normalized_time))
+    cos_time = np.nan_to_num(np.cos(2 * np.pi * normalized_time))
+    return np.stack([sin_time, cos_time], axis=-1).astype(np.float32)
+
+def frame_timestamp(folder_name, file_name):
+    base_time = extract_base_time_from_folder(folder_name)
+    if base_time is None:
+        return np.nan
+    return datetime_to_timestamp(base_time + timedelta(seconds=extract_frame_number(file_name)))
@@ -0,0 +1,74 @@
+import os
+import hashlib
+import numpy as np
+from utils import profiling
+from utils.snapshot_store import _replace_atomic
+
+_topology_cache = {}
+
+def topology_key(coords, dist_threshold):
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    digest = hashlib.sha1(coords.tobytes())
+    digest.update(str(coords.shape).encode())
+    digest.update(repr(float(dist_threshold)).encode())
+    return digest.hexdigest()
+
+def compute_topology(coords, dist_threshold):
+    # scipy is only loaded once a graph actually has to be built; cache hits
+    # and the ingest/label entry points never need it.
+    from scipy.spatial import cKDTree
+    coords = np.asarray(coords, dtype=np.float64)
+    sigma = dist_threshold / 2
+
+    pairs = cKDTree(coords).query_pairs(r=dist_threshold, output_type="ndarray")
+    if len(pairs) == 0:
+        return np.empty((2, 0), dtype=np.int64), np.empty((0,), dtype=np.float32)
+
+    # query_pairs only yields i < j; mirror them and restore (i, j) row-major
+    # order so the edge list matches the dense distance-matrix scan.
+    src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+
+    dist = np.linalg.norm(coords[src] - coords[dst], axis=1)
+    edge_index = np.vstack([src, dst]).astype(np.int64)
+    edge_weight = np.exp(-(dist ** 2) / (2 * sigma ** 2)).astype(np.float32)
+    return edge_index, edge_weight
+
+def load_cached_topology(cache_dir, key):
+    path = os.path.join(cache_dir, f"topology_{key}.npz")
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as cached:
+        return cached["edge_index"], cached["edge_weight"]
+
+def save_cached_topology(cache_dir, key, edge_index, edge_weight):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"topology_{key}.npz")
+    _replace_atomic(lambda tmp_path: np.savez(tmp_path, edge_index=edge_index, edge_weight=edge_weight), path,
+                    suffix=".tmp.npz")
+
+def build_topology(coords, dist_threshold, cache_dir=None):
+    # In-process cache first, then (with cache_dir) the on-disk graph cache
+    # shared across runs, then a fresh radius search.
+    key = topology_key(coords, dist_threshold)
+    topology = _topology_cache.get(key)
+    if topology is None:
+        cached = load_cached_topology(cache_dir, key) if cache_dir else None
+        if cached is not None:
+            edge_index, edge_weight = cached
+        else:
+            with profiling.span("build_topology", num_nodes=len(coords)):
+                edge_index, edge_weight = compute_topology(coords, dist_threshold)
+            profiling.count("graphs_built")
+            if cache_dir:
+                save_cached_topology(cache_dir, key, edge_index, edge_weight)
+        edge_index.setflags(write=False)
+        edge_weight.setflags(write=False)
+        topology = (edge_index, edge_weight)
+        _topology_cache[key] = topology
+    return topology
+
+def clear_topology_cache():
+    _topology_cache.clear()
@@ -1,18 +1,24 @@
+import os
+import contextlib
 import torch
 from tqdm import tqdm
 from torch_geometric_temporal.nn.recurrent import EvolveGCNO
+from model.GNN import carry_state, detach_state
+from utils.checkpointing import atomic_save
+from utils import profiling
 
-def save_checkpoint(model, optimizer, scheduler, epoch, train_losses, val_losses):
-  checkpoint = {
-          'epoch': epoch,
-          'model_state_dict': model.state_dict(),
-          'optimizer_state_dict': optimizer.state_dict(),
-          'scheduler_state_dict': scheduler.state_dict(),
-          'train_losses': train_losses,
-          'val_losses': val_losses,
-      }
-  torch.save(checkpoint, f'/checkpoints/tfpp_checkpoint_{epoch}.pt')
-  torch.save(model.state_dict(), f'/models/tfpp_model_{epoch}.pt')
+def save_checkpoint(model, optimizer, scheduler, epoch, train_losses, val_losses, directory="checkpoints"):
+    # Synchronous one-off save; training goes through CheckpointManager.
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = {
+        'epoch': epoch,
+        'model_state_dict': model.state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'scheduler_state_dict': scheduler.state_dict(),
+        'train_losses': train_losses,
+        'val_losses': val_losses,
+    }
+    atomic_save(checkpoint, os.path.join(directory, f'tfpp_checkpoint_{epoch}.pt'))
 
 def load_checkpoint(filepath, model, optimizer, scheduler):
     checkpoint = torch.load(filepath, map_location=torch.device('cpu'))
@@ -24,42 +30,115 @@ def load_checkpoint(filepath, model, optimizer, scheduler):
     val_losses = checkpoint['val_losses']
     return model, optimizer, scheduler, start_epoch, train_losses, val_losses
 
-def train_loop(loader, model, criterion, optimizer, device, verbose=True):
+def autocast(device, amp_dtype):
+    # amp_dtype=None keeps plain fp32; torch.bfloat16 is the one to use on CPU.
+    return torch.autocast(device_type=torch.device(device).type, dtype=amp_dtype, enabled=amp_dtype is not None)
+
+def masked(out, y, snapshot):
+    # Cluster batches only score their core nodes; halo rows are context.
+    mask = getattr(snapshot, "mask", None)
+    if mask is None:
+        return out, y
+    return out[mask], y[mask]
+
+def train_loop(loader, model, criterion, optimizer, device, verbose=True, stateful=False, tbptt_steps=8,
+               amp_dtype=None, accumulate_steps=1, log_interval=100):
     model.train()
-    total_loss = 0.0
+    # Running loss stays on the device; it is only synced at log intervals.
+    total_loss = torch.zeros((), device=device)
     num_batches = 0
 
-    for t, snapshot in enumerate(tqdm(loader)):
-        snapshot = snapshot.to(device)
+    # In stateful mode hidden states flow from one snapshot to the next and
+    # gradients are truncated every tbptt_steps snapshots.
+    state = previous_batch = None
+    window_loss = 0.0
+    window_steps = 0
 
-        out = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr)
-        loss = criterion(out, snapshot.y.float())
+    # Gradients from accumulate_steps backward passes are summed before each
+    # optimizer step. Under DistributedDataParallel only the last backward
+    # before a step (or the end of the shard) allreduces; the others run in
+    # no_sync(), which has to cover their forward passes too.
+    backward_steps = 0
+    optimizer.zero_grad()
+    no_sync = getattr(model, "no_sync", None) if accumulate_steps > 1 else None
+    last_batch = len(loader) - 1 if no_sync is not None else None
 
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
+    def sync_context(t):
+        if no_sync is None or (backward_steps + 1) % accumulate_steps == 0 or t == last_batch:
+            return contextlib.nullcontext()
+        return no_sync()
+
+    def backward(loss):
+        nonlocal backward_steps
+        with profiling.span("backward"):
+            (loss / accumulate_steps).backward()
+        backward_steps += 1
+        if backward_steps % accumulate_steps == 0:
+            with profiling.span("optimizer_step"):
+                optimizer.step()
+                optimizer.zero_grad()
+
+    for t, snapshot in enumerate(tqdm(loader, disable=not verbose)):
+        with profiling.span("host_to_device"):
+            snapshot = snapshot.to(device)
 
-        total_loss += loss.item()
+        with sync_context(t):
+            with profiling.span("forward"), autocast(device, amp_dtype):
+                if stateful:
+                    state = carry_state(state, previous_batch, snapshot)
+                    previous_batch = snapshot.batch
+                    out, state = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr, state=state,
+                                       return_state=True)
+                else:
+                    out = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr)
+                loss = criterion(*masked(out.float(), snapshot.y.float(), snapshot))
+            profiling.count("train_batches")
+
+            window_loss = window_loss + loss
+            window_steps += 1
+            if not stateful or window_steps == tbptt_steps:
+                backward(window_loss / window_steps)
+                state = detach_state(state)
+                window_loss = 0.0
+                window_steps = 0
+
+        total_loss += loss.detach()
         num_batches += 1
 
-        if verbose and (t + 1) % 100 == 0:
-            print(f"Batch {t + 1}, Loss: {total_loss / num_batches:.6f}")
+        if verbose and (t + 1) % log_interval == 0:
+            print(f"Batch {t + 1}, Loss: {total_loss.item() / num_batches:.6f}")
+
+    if window_steps > 0:
+        backward(window_loss / window_steps)
+    if backward_steps % accumulate_steps:
+        optimizer.step()
+        optimizer.zero_grad()
 
-    return total_loss / max(1, num_batches)
+    profiling.record_memory()
+    return total_loss.item() / max(1, num_batches)
 
-def val_loop(loader, model, criterion, device, verbose=False):
+def val_loop(loader, model, criterion, device, verbose=False, stateful=False, amp_dtype=None):
     model.eval()
-    total_loss = 0.0
+    total_loss = torch.zeros((), device=device)
     num_batches = 0
+    state = previous_batch = None
 
     with torch.no_grad():
         for t, snapshot in enumerate(loader):
-            snapshot = snapshot.to(device)
+            with profiling.span("host_to_device"):
+                snapshot = snapshot.to(device)
 
-            out = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr)
-            loss = criterion(out, snapshot.y.float())
+            with profiling.span("val_forward"), autocast(device, amp_dtype):
+                if stateful:
+                    state = carry_state(state, previous_batch, snapshot)
+                    previous_batch = snapshot.batch
+                    out, state = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr, state=state,
+                                       return_state=True)
+                else:
+                    out = model(snapshot.x, snapshot.edge_index, snapshot.edge_attr)
+                loss = criterion(*masked(out.float(), snapshot.y.float(), snapshot))
 
-            total_loss += loss.item()
+            total_loss += loss
             num_batches += 1
 
             if verbose and (t + 1) % 50 == 0:
@@ -67,4 +146,4 @@ def val_loop(loader, model, criterion, device, verbose=False):
                 print(f"Preds:  {torch.sigmoid(out[:3])}")
                 print(f"Target: {snapshot.y[:3]}")
 
-    return total_loss / max(1, num_batches)
\ No newline at end of file
+    return total_loss.item() / max(1, num_batches)